@@ -0,0 +1,73 @@
+import os
+
+# Настройки обработки свободного текста (NLP)
+
+# Режим выполнения: "pool" - в пуле процессов, "local" - в отдельном потоке основного процесса
+NLP_MODE = "pool"
+# Количество процессов пула, в каждом заранее загружена модель spaCy
+NLP_POOL_SIZE = os.cpu_count() or 1
+# Сколько секунд ждать ответа на одно сообщение
+NLP_TIMEOUT = 10.0
+# Микропакеты: сколько сообщений собирать в один вызов nlp.pipe и сколько секунд ждать
+# (NLP_BATCH_MAX_SIZE = 1 отключает пакетирование)
+NLP_BATCH_MAX_SIZE = 16
+NLP_BATCH_MAX_WAIT = 0.005
+# Что делать с текстом, пока модель загружается в фоне:
+# "regex" - сразу ответить по регулярным выражениям базы знаний, "queue" - дождаться загрузки
+NLP_NOT_READY_POLICY = "regex"
+# Загружать модель сразу при старте бота (True) или только при первом свободном тексте (False)
+NLP_PRELOAD = True
+# Оценка категорий по ключевым словам: "index" - обратный индекс в цикле,
+# "vector" - одно умножение разреженной матрицы признаков на вектор сообщения (numpy)
+NLP_ENGINE = "index"
+# Для "vector": доля оценки по символьным n-граммам (0 - оценки точно как у "index")
+NLP_VECTOR_NGRAM_WEIGHT = 0.0
+# Как часто (в секундах) проверять, не изменился ли файл базы знаний request/knowledge_base.json
+# (0 - не следить, перезагрузка только командой /reload_kb)
+NLP_KB_WATCH_INTERVAL = 5.0
+# Трассировка этапов обработки (нормализация, леммы, опечатки, шаблоны, ключевые слова, запись в базу):
+# по скольким последним сообщениям держать статистику и с какой задержки (мс) писать разбор в лог
+NLP_TRACE = False
+NLP_TRACE_WINDOW = 1000
+NLP_TRACE_SLOW_MS = 500
+
+# Настройки логирования
+
+# "queue" - обработчики (файлы bot.log, unrecognized.log и консоль) пишут из фонового потока
+# основного процесса, рабочие процессы пула NLP передают ему записи через очередь;
+# "direct" - запись прямо из потока, который вызвал logging
+LOG_MODE = "queue"
+# Одинаковые сообщения пишутся один раз за столько секунд, затем строка с числом повторов (0 - писать все)
+LOG_DEDUP_WINDOW = 60.0
+# Сколько DEBUG-записей в секунду пропускать с одной строки кода logging.debug (0 - без ограничения)
+LOG_DEBUG_RATE = 10
+# Сжимать ротированные логи в gzip (bot.log.1.gz, ...)
+LOG_COMPRESS_ROTATED = True
+
+# Настройки базы данных бота (SQLite)
+
+DB_PATH = 'user_data.db'
+# Соединения переиспользуются (по одному на поток) и работают в режиме WAL: чтение не ждёт записи.
+# synchronous: "NORMAL" - в WAL не теряет целостность и не ждёт диска при каждом commit, "FULL" - надёжнее
+DB_SYNCHRONOUS = "NORMAL"
+# Размер кэша страниц (отрицательное значение - в КиБ) и сколько байт файла читать через mmap (0 - не использовать)
+DB_CACHE_SIZE = -16000
+DB_MMAP_SIZE = 64 * 1024 * 1024
+# Сколько секунд ждать, если база занята другой записью
+DB_BUSY_TIMEOUT = 5.0
+# Сколько потоков выполняют запросы обработчиков (у каждого своё соединение); цикл событий их не ждёт
+DB_POOL_SIZE = 4
+# Все изменения базы выполняет один писатель, объединяя ожидающие записи в одну транзакцию (один fsync).
+# Сколько секунд он ждёт следующих записей перед commit (0 - commit, как только очередь опустела;
+# больше - меньше commit под нагрузкой, но дольше ответ) и сколько записей кладёт в одну транзакцию
+DB_COMMIT_LATENCY = 0.005
+DB_WRITE_BATCH_MAX = 100
+# Роли пользователей (админ/пользователь) кэшируются в памяти бота: сколько секунд живёт запись
+# обычного пользователя, запись администратора и список администраторов, запись о пользователе,
+# которого нет в базе, и сколько записей держать.
+# Права меняются в базе вручную: снятые права администратора перестают действовать не позже
+# чем через ROLE_CACHE_ADMIN_TTL, выданные - через ROLE_CACHE_TTL
+ROLE_CACHE_TTL = 300.0
+ROLE_CACHE_ADMIN_TTL = 10.0
+ROLE_CACHE_NEGATIVE_TTL = 30.0
+ROLE_CACHE_MAX = 10000
@@ -0,0 +1,68 @@
+import sqlite3
+import logging
+import threading
+
+from config import DB_PATH, DB_SYNCHRONOUS, DB_CACHE_SIZE, DB_MMAP_SIZE, DB_BUSY_TIMEOUT
+
+
+class Database:
+    #Переиспользуемые соединения с базой бота: по одному на поток, открываются при первом
+    #обращении из потока и живут до close(). Соединение sqlite3 нельзя делить между потоками,
+    #поэтому у цикла событий aiogram своё соединение, у каждого рабочего потока - своё.
+
+    def __init__(self, path=DB_PATH, synchronous=DB_SYNCHRONOUS, cache_size=DB_CACHE_SIZE,
+                 mmap_size=DB_MMAP_SIZE, timeout=DB_BUSY_TIMEOUT):
+        self.path = path
+        self.synchronous = synchronous
+        self.cache_size = cache_size
+        self.mmap_size = mmap_size
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._wal_enabled = False
+
+    def connection(self):
+        #Соединение текущего потока
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def _connect(self):
+        # check_same_thread=False только для того, чтобы close() мог закрыть соединения
+        # всех потоков; пользуется соединением по-прежнему один поток
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+        with self._lock:
+            if not self._wal_enabled:
+                # Режим журнала хранится в самом файле базы, достаточно включить один раз
+                mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+                if mode.lower() != "wal":
+                    logging.warning("SQLite journal_mode is %s, WAL is not available for %s", mode, self.path)
+                self._wal_enabled = True
+            self._connections.append(conn)
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute(f"PRAGMA cache_size={int(self.cache_size)}")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        logging.debug("SQLite connection opened for %s in thread %s", self.path, threading.current_thread().name)
+        return conn
+
+    def close(self):
+        #Закрывает соединения всех потоков (при остановке бота)
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logging.error(f"Error closing SQLite connection: {e}")
+        self._local = threading.local()
+
+
+# Общий экземпляр для бота
+database = Database()
+
+
+def get_connection():
+    return database.connection()
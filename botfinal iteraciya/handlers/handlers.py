@@ -7,22 +7,18 @@ from utils import *
 import logging
 from request import *
 from request.request_admin import *
-from request.nlp import *
+from request.nlp_service import NLPService, format_stats
 from aiogram.types import reply_keyboard_markup, keyboard_button
 import keyboards.keyboards as kb
 from datetime import datetime
 from aiogram import types
-import nltk
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
-import random
 
-nlp_processor = NLPProcessor()
+# Обработка свободного текста, запускается из run.py (spaCy грузится только внутри NLPService)
+nlp_service = NLPService()
 processed_messages = {}
 
 
-# Настройка логгирования
-logging.basicConfig(level=logging.INFO)
+# Логирование настраивается в run.py
 logger = logging.getLogger(__name__)
 
 router = Router()
@@ -48,7 +44,7 @@ class TariffForm(StatesGroup):
 
 #запрос /start
 @router.message(Command("start"))  # Обработчик команды /start
-async def start_command(message: Message):
+async def start_command(message: Message, db, role):
     processed_messages[message.message_id] = True
 
     user_id = message.from_user.id
@@ -57,48 +53,27 @@ async def start_command(message: Message):
     last_name = message.from_user.last_name or ""
     fio = f"{first_name} {last_name}".strip()
     
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Проверяем, есть ли пользователь в базе
-    cursor.execute('SELECT admin_status FROM users_table WHERE user_id = ?', (user_id,))
-    user_data = cursor.fetchone()
-    
-    if user_data:
-        if user_data[0] == 1:
+    # Проверяем, есть ли пользователь в базе (роль определил AuthMiddleware)
+    if role is not None:
+        if role == ROLE_ADMIN:
             await message.answer('Привет, админ!', reply_markup=kb.main_kb)
         else:
             await message.answer('Привет, пользователь!', reply_markup=kb.main_kb)
     else:
         try:
-            cursor.execute('''
-                INSERT INTO users_table (user_id, username, fio, admin_status)
-                VALUES (?, ?, ?, 0)
-            ''', (user_id, username, fio))
-            conn.commit()
+            await db.users.add(user_id, username, fio)
             await message.answer('Добро пожаловать! Вы были добавлены в систему.', reply_markup=kb.main_kb)
         except Exception as e:
             await message.answer(f'Ошибка при добавлении в базу: {str(e)}')
-        finally:
-            conn.close()
             
-# Функция для проверки прав администратора
-def is_user_admin(user_id: int) -> bool:
-    with sqlite3.connect('user_data.db') as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT admin_status FROM users_table WHERE user_id=?", (user_id,))
-        result = cursor.fetchone()
-        return result[0] if result else False
-
 @router.message(F.text == 'Оборудование в продаже')
-async def show_routers(message: types.Message):
+async def show_routers(message: types.Message, db, role):
     processed_messages[message.message_id] = True
-    user_id = message.from_user.id
     
     # Проверяем права пользователя
-    is_admin = is_user_admin(user_id)
+    is_admin = role == ROLE_ADMIN
     
-    routers = get_all_routers()
+    routers = await db.routers.get_all()
     if not routers:
         reply_text = "Роутеры не найдены."
         if is_admin:
@@ -121,34 +96,15 @@ class FeedbackStates(StatesGroup):
 
 
 
-async def get_admins_ids():
+async def get_admins_ids(db):
     
     #Получаем список ID администраторов из базы
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT user_id FROM users_table WHERE admin_status = 1")
-        admins = [row[0] for row in cursor.fetchall()]
+        admins = await db.users.get_admin_ids()
         return admins if admins else [1349520375]  # Возвращаем ваш ID как fallback
     except Exception as e:
         logger.error(f"Error getting admins list: {e}")
         return 
-    finally:
-        conn.close()
-
-async def is_admin(user_id: int) -> bool:
-    #Проверка, является ли пользователь администратором
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT admin_status FROM users_table WHERE user_id = ?", (user_id,))
-        result = cursor.fetchone()
-        return result and result[0] == 1
-    except Exception as e:
-        logger.error(f"Error checking admin status: {e}")
-        return False
-    finally:
-        conn.close()
 
 @router.message(F.text == 'Обратная связь')
 async def start_feedback(message: types.Message, state: FSMContext):
@@ -161,21 +117,13 @@ async def start_feedback(message: types.Message, state: FSMContext):
     await state.set_state(FeedbackStates.waiting_for_feedback)
 
 @router.message(FeedbackStates.waiting_for_feedback)
-async def process_feedback(message: types.Message, state: FSMContext, bot: Bot):
+async def process_feedback(message: types.Message, state: FSMContext, bot: Bot, db):
     user = message.from_user
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO feedback_table 
-            (user_fb_id, username_fb, message)
-            VALUES (?, ?, ?)
-        ''', (user.id, user.username, message.text))
-        conn.commit()
+        await db.feedback.add(user.id, user.username, message.text)
 
         # Получаем список администраторов
-        admins = await get_admins_ids()
+        admins = await get_admins_ids(db)
         success_sent = False
         
         for admin_id in admins:
@@ -201,15 +149,13 @@ async def process_feedback(message: types.Message, state: FSMContext, bot: Bot):
         print(f"Feedback processing error: {e}")
         #await message.answer("❌ Произошла ошибка при обработке вашего сообщения")
     finally:
-        if 'conn' in locals():
-            conn.close()
         await state.clear()
 
 @router.message(Command("reply"))
-async def admin_reply(message: types.Message, bot: Bot):
+async def admin_reply(message: types.Message, bot: Bot, db, role):
     processed_messages[message.message_id] = True
 
-    if not await is_admin(message.from_user.id):
+    if role != ROLE_ADMIN:
         await message.answer("❌ У вас нет прав для этой команды")
         return
 
@@ -239,23 +185,10 @@ async def admin_reply(message: types.Message, bot: Bot):
             send_success = False
 
         # Обновляем статус в базе
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE feedback_table 
-            SET status = ?,
-                admin_id = ?,
-                reply_message = ?
-            WHERE user_fb_id = ? AND status = 'new'
-        ''', ('replied' if send_success else 'failed', 
-              message.from_user.id, 
-              reply_text, 
-              user_id))
-        
-        conn.commit()
+        updated = await db.feedback.reply(user_id, message.from_user.id, reply_text,
+                                          'replied' if send_success else 'failed')
         
-        if cursor.rowcount == 0:
+        if updated == 0:
             await message.answer(f"⚠ Нет неотвеченных сообщений от пользователя {user_id}")
         else:
             status_msg = "✅ Ответ отправлен" if send_success else "⚠ Ответ сохранен, но не отправлен"
@@ -266,30 +199,17 @@ async def admin_reply(message: types.Message, bot: Bot):
     except Exception as e:
         logger.error(f"Admin reply error: {e}")
         await message.answer("❌ Произошла ошибка при обработке команды")
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 # команда /feedback_list  (в будущем доработать) для получения фидбек сообщений от юзеров
 @router.message(Command("feedback_list"))
-async def list_feedback(message: types.Message):
+async def list_feedback(message: types.Message, db, role):
     processed_messages[message.message_id] = True
 
-    if not await is_admin(message.from_user.id):
+    if role != ROLE_ADMIN:
         return
 
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT id_fb, user_fb_id, username_fb, message, created_at 
-            FROM feedback_table 
-            WHERE status = 'new'
-            ORDER BY created_at DESC
-            LIMIT 50
-        ''')
-        
-        feedbacks = cursor.fetchall()
+        feedbacks = await db.feedback.get_new(50)
         
         if not feedbacks:
             await message.answer("📭 Нет новых сообщений")
@@ -315,10 +235,52 @@ async def list_feedback(message: types.Message):
     except Exception as e:
         logger.error(f"Feedback list error: {e}")
         await message.answer("❌ Ошибка при получении списка сообщений")
-    finally:
-        conn.close()
     
 
+# команда /reload_kb - перечитать базу знаний NLP без перезапуска бота
+@router.message(Command("reload_kb"))
+async def admin_reload_kb(message: types.Message, role):
+    processed_messages[message.message_id] = True
+
+    if role != ROLE_ADMIN:
+        await message.answer("❌ У вас нет прав для этой команды")
+        return
+
+    await message.answer("⏳ Перезагружаю базу знаний...")
+    try:
+        categories = await nlp_service.reload_knowledge_base()
+    except ValueError as e:
+        await message.answer(f"❌ Ошибка в базе знаний, оставлена прежняя версия:\n{e}")
+        return
+    except Exception as e:
+        logger.error(f"Knowledge base reload error: {e}")
+        await message.answer("❌ Не удалось перезагрузить базу знаний")
+        return
+    await message.answer(f"✅ База знаний обновлена, категорий: {categories}")
+
+
+# команда /nlp_stats - статистика NLP (шаблоны, кэши, этапы) из всех процессов пула
+@router.message(Command("nlp_stats"))
+async def admin_nlp_stats(message: types.Message, role):
+    processed_messages[message.message_id] = True
+
+    if role != ROLE_ADMIN:
+        await message.answer("❌ У вас нет прав для этой команды")
+        return
+
+    try:
+        stats = await nlp_service.collect_stats()
+    except Exception as e:
+        logger.error(f"NLP stats error: {e}")
+        await message.answer("❌ Не удалось получить статистику NLP")
+        return
+    logger.info("NLP stats: %s", stats)
+    text = format_stats(stats)
+    # Сообщение Telegram ограничено 4096 символами
+    for start in range(0, len(text), 4000):
+        await message.answer(text[start:start + 4000])
+
+
 #запрос кнопка "кто ты? Бот для обратной связи" - кнопка убрана, команда 'кто ты?' осталась
 @router.message(F.text == 'Кто ты?')
 async def who_are_you(message : Message):
@@ -328,14 +290,13 @@ async def who_are_you(message : Message):
 
 #запрос кнопка "Актуальные тарифные планы"
 @router.message(F.text == 'Актуальные тарифные планы')
-async def show_tariffs(message: types.Message):
+async def show_tariffs(message: types.Message, db, role):
     processed_messages[message.message_id] = True
-    user_id = message.from_user.id
     
     # Проверяем права пользователя
-    is_admin = is_user_admin(user_id)
+    is_admin = role == ROLE_ADMIN
     #user_id = message.from_user.id
-    tarifs = get_all_tariffs()
+    tarifs = await db.tariffs.get_all()
     if not tarifs:
         reply_text = "Роутеры не найдены."
         if is_admin:
@@ -363,10 +324,10 @@ async def main_menu(message : Message):
 #FSM начало роутерс добавление роутера
 
 @router.message(F.text == 'Добавление роутера')
-async def add_router1(message: Message, state: FSMContext):
+async def add_router1(message: Message, state: FSMContext, role):
     
 
-    if not admin_authorized(message.from_user.id):
+    if role != ROLE_ADMIN:
         await message.answer("❌ Эта команда только для администраторов")
         return
     processed_messages[message.message_id] = True
@@ -430,31 +391,14 @@ async def add_router6(message: Message, state: FSMContext):
     await message.answer('Введите количество портов (число)')
 
 @router.message(routerreg.routerports)
-async def add_router7(message: Message, state: FSMContext):
+async def add_router7(message: Message, state: FSMContext, db):
     processed_messages[message.message_id] = True
 
     try:
         ports = int(message.text)
         await state.update_data(routerports=ports)
         data = await state.get_data()
-        conn = sqlite3.connect('user_data.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-    INSERT INTO routers_table (model_id, model_name, model_cost, mesh, tariff_1000, g5_diap, number_ports)
-    SELECT COALESCE(MAX(model_id), 0) + 1, ?, ?, ?, ?, ?, ? 
-    FROM routers_table
-''', (
-            data['routername'],
-            data['routercost'],
-            data['routermesh'],
-            data['routertariff'],
-            data['routerg5'],
-            data['routerports'],
-))
-
-        
-        conn.commit()
-        conn.close()
+        await db.routers.add(data)
         
         await message.answer(
             f"✅ Роутер  успешно добавлен!\n"
@@ -485,14 +429,14 @@ class EditRouter(StatesGroup):
     routerports = State()
 #поиск по id 
 @router.message(F.text == 'Изменение роутера')
-async def edit_router_start(message: Message, state: FSMContext):
+async def edit_router_start(message: Message, state: FSMContext, db, role):
     
 
-    if not admin_authorized(message.from_user.id):
+    if role != ROLE_ADMIN:
         await message.answer("❌ Эта команда только для администраторов")
         return
     processed_messages[message.message_id] = True
-    routers = get_all_routers()
+    routers = await db.routers.get_all()
     if not routers:
         await message.answer("Нет доступных роутеров для изменения")
         return
@@ -505,12 +449,12 @@ async def edit_router_start(message: Message, state: FSMContext):
 
 #после id -> изменение нэйма 
 @router.message(EditRouter.waiting_for_router_id)
-async def edit_router_id(message: Message, state: FSMContext):
+async def edit_router_id(message: Message, state: FSMContext, db):
     processed_messages[message.message_id] = True
 
     try:
         router_id = int(message.text)
-        router = get_router_by_id(router_id)
+        router = await db.routers.get_by_id(router_id)
         if not router:
             await message.answer(f"Роутер с ID {router_id} не найден")
             await state.clear()
@@ -594,7 +538,7 @@ async def edit_router_g5(message: Message, state: FSMContext):
     await message.answer(f"Текущее количество портов: {data['routerports']}\nВведите новое количество портов (число, или 'пропустить'):")
 
 @router.message(EditRouter.routerports)
-async def edit_router_ports(message: Message, state: FSMContext):
+async def edit_router_ports(message: Message, state: FSMContext, db):
     processed_messages[message.message_id] = True
 
     if message.text.lower() != 'пропустить':
@@ -607,7 +551,7 @@ async def edit_router_ports(message: Message, state: FSMContext):
     
     data = await state.get_data()
     try:
-        update_router_in_db(data['router_id'], data)
+        await db.routers.update(data['router_id'], data)
         await message.answer(
            # f"✅ Роутер с ID {data['model_id']} успешно обновлён!\n"
             f"Модель: {data['routername']}\n"
@@ -624,25 +568,6 @@ async def edit_router_ports(message: Message, state: FSMContext):
     finally:
         await state.clear()
 
-def update_router_in_db(router_id, data):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE routers_table
-        SET model_name = ?, model_cost = ?, mesh = ?, tariff_1000 = ?, g5_diap = ?, number_ports = ?
-        WHERE model_id = ?
-    ''', (
-        data['routername'],
-        data['routercost'],
-        data['routermesh'],
-        data['routertariff'],
-        data['routerg5'],
-        data['routerports'],
-        router_id
-    ))
-    conn.commit()
-    conn.close()
-    return True   
 
 #FSM ДЛЯ УДАЛЕНИЯ РОУТЕРА
 class DeleteRouter(StatesGroup):
@@ -650,15 +575,15 @@ class DeleteRouter(StatesGroup):
     confirmation = State()
 
 @router.message(F.text == 'Удаление роутера')
-async def delete_router_start(message: Message, state: FSMContext):
+async def delete_router_start(message: Message, state: FSMContext, db, role):
   
 
-    if not admin_authorized(message.from_user.id):
+    if role != ROLE_ADMIN:
         await message.answer("❌ Эта команда только для администраторов")
         return
     # Показываем все роутеры для наглядности
     processed_messages[message.message_id] = True
-    routers= get_all_routers()
+    routers= await db.routers.get_all()
     if not routers:
         await message.answer("Нет доступных роутеров для удаления") #в случае если таблица с роутерами пустая выдаст что роутеров нет
         return
@@ -670,12 +595,12 @@ async def delete_router_start(message: Message, state: FSMContext):
     await state.set_state(DeleteRouter.waiting_for_router_id)
 
 @router.message(DeleteRouter.waiting_for_router_id)
-async def delete_router_by_id(message: Message, state: FSMContext):
+async def delete_router_by_id(message: Message, state: FSMContext, db):
     processed_messages[message.message_id] = True
 
     try:
         router_id = int(message.text)
-        if delete_router_from_db(router_id):
+        if await db.routers.delete(router_id):
             await message.answer(f"Роутер с ID {router_id} успешно удалён")
         else:
             await message.answer(f"Роутер с ID {router_id} не найден")
@@ -687,14 +612,14 @@ async def delete_router_by_id(message: Message, state: FSMContext):
 
 
 @router.message(DeleteRouter.waiting_for_router_id)
-async def confirm_deletion(message: Message, state: FSMContext):
+async def confirm_deletion(message: Message, state: FSMContext, db):
     processed_messages[message.message_id] = True
 
     router_id = int(message.text)
     await state.update_data(router_id=router_id)
     
     # Показываем информацию о роутере
-    router = get_router_by_id(router_id)
+    router = await db.routers.get_by_id(router_id)
     await message.answer(
         f"Вы действительно хотите удалить этот тариф?\n"
         f"{format_router_for_display(router)}\n"
@@ -713,10 +638,10 @@ async def confirm_deletion(message: Message, state: FSMContext):
 #добавление тарифа FSM
 
 @router.message(F.text == 'Добавление тарифа')
-async def addtariff1(message:Message ,state:FSMContext):
+async def addtariff1(message:Message ,state:FSMContext, role):
     
 
-    if not admin_authorized(message.from_user.id):
+    if role != ROLE_ADMIN:
         await message.answer("❌ Эта команда только для администраторов")
         return
     processed_messages[message.message_id] = True
@@ -771,7 +696,7 @@ async def add_tariff5(message:Message, state:FSMContext):
         await message.answer('❌ Введите число или "нет"!')
 
 @router.message(TariffForm.akciya)
-async def add_tariff6(message:Message, state: FSMContext):
+async def add_tariff6(message:Message, state: FSMContext, db):
     
 
     if message.text.lower() not in ['да','нет']:
@@ -780,22 +705,7 @@ async def add_tariff6(message:Message, state: FSMContext):
     processed_messages[message.message_id] = True
     await state.update_data(akciya=message.text.lower() == 'да')
     data = await state.get_data()
-    conn = sqlite3.connect('user_data.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO tariffs_table (id_tarif, tarif_name, stoimost_tarif, stoimost_6month, stoimost_12month, akciya)
-        SELECT COALESCE(MAX(id_tarif), 0) + 1, ?, ?, ?, ?, ?
-        FROM tariffs_table
-    ''', 
-    (
-        data['tarif_name'],
-        data['stoimost_tarif'],
-        data['stoimost_6month'],
-        data['stoimost_12month'],
-        data['akciya'],
-    ))
-    conn.commit()
-    conn.close()
+    await db.tariffs.add(data)
    
     await message.answer(
         f"✅ Тариф успешно добавлен!\n"
@@ -820,14 +730,14 @@ class EditTariff(StatesGroup):
 
 #Изменение тарифа
 @router.message(F.text == 'Изменение тарифа')
-async def edit_tarif(message: Message, state: FSMContext):
+async def edit_tarif(message: Message, state: FSMContext, db, role):
     
 
-    if not admin_authorized(message.from_user.id):
+    if role != ROLE_ADMIN:
         await message.answer("❌ Эта команда только для администраторов")
         return
     processed_messages[message.message_id] = True
-    tariffs = get_all_tariffs()
+    tariffs = await db.tariffs.get_all()
     if not tariffs:
         await message.answer("Нет доступных тарифов для изменения")
         return
@@ -840,12 +750,12 @@ async def edit_tarif(message: Message, state: FSMContext):
 
 #поиск по ID, изменение name    
 @router.message(EditTariff.waiting_for_tariff_id)
-async def edit_tarif_id(message:Message, state:FSMContext):
+async def edit_tarif_id(message:Message, state:FSMContext, db):
     processed_messages[message.message_id] = True
 
     try:
         tariff_id = int(message.text)
-        tarif = get_tarifs_by_id(tariff_id)
+        tarif = await db.tariffs.get_by_id(tariff_id)
         if not tarif:
             await message.answer(f"Тариф с таким ID {tariff_id} не найден")
             await state.clear()
@@ -927,7 +837,7 @@ async def edit_tarif_12_month(message:Message, state : FSMContext):
                          f"Тариф по акции? (Да/Нет/пропустить):")     
 
 @router.message(EditTariff.editakciya)
-async def edit_tarif_akciya(message:Message, state:FSMContext):
+async def edit_tarif_akciya(message:Message, state:FSMContext, db):
     processed_messages[message.message_id] = True
 
     if message.text.lower() not in ['да', 'нет', 'пропустить']:
@@ -938,7 +848,7 @@ async def edit_tarif_akciya(message:Message, state:FSMContext):
     
     data = await state.get_data()
     try:
-        update_tariff_in_db(data['tariff_id'], data)
+        await db.tariffs.update(data['tariff_id'], data)
         await message.answer(
         #    f"✅ Тариф с ID {data['tariff_id']} успешно обновлён!\n"
             f"Название: {data['tariff_name']}\n"
@@ -954,23 +864,6 @@ async def edit_tarif_akciya(message:Message, state:FSMContext):
     finally:
         await state.clear()
 
-def update_tariff_in_db(tariff_id, data):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE tariffs_table
-        SET tarif_name = ?, stoimost_tarif = ?, stoimost_6month = ?, stoimost_12month = ?, akciya = ?
-        WHERE id_tarif = ?
-''',    ( data['tariff_name'],
-        data['tarifcost'],
-        data['cost_6month'],
-        data['cost_12month'],
-        data['editakciya'],
-        tariff_id
-    ))
-    conn.commit()
-    conn.close()
-    return True      
 
 
 #FSM ДЛЯ УДАЛЕНИЯ ТАРИФА
@@ -980,15 +873,15 @@ class DeleteTariff(StatesGroup):
     confirmation = State()
 
 @router.message(F.text == 'Удаление тарифа')
-async def delete_tariff_start(message: Message, state: FSMContext):
+async def delete_tariff_start(message: Message, state: FSMContext, db, role):
     
 
-    if not admin_authorized(message.from_user.id):
+    if role != ROLE_ADMIN:
         await message.answer("❌ Эта команда только для администраторов")
         return
     processed_messages[message.message_id] = True
     # Показываем все тарифы для наглядности
-    tariffs = get_all_tariffs()
+    tariffs = await db.tariffs.get_all()
     if not tariffs:
         await message.answer("Нет доступных тарифов для удаления")
         return
@@ -1000,12 +893,12 @@ async def delete_tariff_start(message: Message, state: FSMContext):
     await state.set_state(DeleteTariff.waiting_for_tariff_id)
 
 @router.message(DeleteTariff.waiting_for_tariff_id)
-async def delete_tariff_by_id(message: Message, state: FSMContext):
+async def delete_tariff_by_id(message: Message, state: FSMContext, db):
     processed_messages[message.message_id] = True
 
     try:
         tariff_id = int(message.text)
-        if delete_tariff_from_db(tariff_id):
+        if await db.tariffs.delete(tariff_id):
             await message.answer(f"Тариф с ID {tariff_id} успешно удалён")
         else:
             await message.answer(f"Тариф с ID {tariff_id} не найден")
@@ -1017,14 +910,14 @@ async def delete_tariff_by_id(message: Message, state: FSMContext):
 
 
 @router.message(DeleteTariff.waiting_for_tariff_id)
-async def confirm_deletion(message: Message, state: FSMContext):
+async def confirm_deletion(message: Message, state: FSMContext, db):
     processed_messages[message.message_id] = True
 
     tariff_id = int(message.text)
     await state.update_data(tariff_id=tariff_id)
     
     # Показываем информацию о тарифе
-    tariff = get_tarifs_by_id(tariff_id)
+    tariff = await db.tariffs.get_by_id(tariff_id)
     await message.answer(
         f"Вы действительно хотите удалить этот тариф?\n"
         f"{format_tarifs_for_display(tariff)}\n"
@@ -1041,40 +934,6 @@ async def confirm_deletion(message: Message, state: FSMContext):
 
 
 
-class NLPResponder:
-    def __init__(self):
-        self._init_nltk()
-        self.stop_words = set(stopwords.words('russian'))
-      #  self.knowledge_base = {
-      #      "привет": ["Здравствуйте! Чем могу помочь?", "Привет! Как я могу вам помочь сегодня?"],
-      #      "проблема": ["Опишите, пожалуйста, вашу проблему подробнее.", "Я постараюсь помочь с вашей проблемой. Что случилось?"],
-      #      "проблемы": ["Опишите, пожалуйста, вашу проблему подробнее.", "Я постараюсь помочь с вашей проблемой. Что случилось?"],
-      #      "интернет": ["Проверьте подключение кабеля и перезагрузите роутер.", "Попробуйте подключиться к другой сети для проверки."],
-       #     "компьютер": ["Попробуйте перезагрузить компьютер.", "Проверьте, все ли кабели подключены правильно."],
-      #      "спасибо": ["Пожалуйста! Обращайтесь, если будут еще вопросы.", "Рад был помочь! Хорошего дня!"],
-      #      "default": ["Извините, я не совсем понял. Можете переформулировать?", "Не уверен, что понял вопрос. Уточните, пожалуйста."]
-      #  }  РАСПИСАЛ в ФАЙЛЕ NLP
-
-    def _init_nltk(self):
-        try:
-            nltk.data.find('tokenizers/punkt')
-            nltk.data.find('corpora/stopwords')
-        except LookupError:
-            nltk.download('punkt_tab')
-            nltk.download('stopwords')
-
-    def preprocess_text(self, text):
-        tokens = word_tokenize(text.lower())
-        return [token for token in tokens if token.isalpha() and token not in self.stop_words]
-
-    async def get_response(self, text):
-        tokens = self.preprocess_text(text)
-        for word in tokens:
-            if word in self.knowledge_base:
-                return random.choice(self.knowledge_base[word])
-        return random.choice(self.knowledge_base["default"])
-
-nlp_responder = NLPResponder()
 
 @router.message()
 async def nlp_fallback_handler(message: types.Message):
@@ -1088,5 +947,5 @@ async def nlp_fallback_handler(message: types.Message):
         
     # Пропускаем если сообщение уже обработано другими обработчиками
     if not getattr(message, 'handled', False):
-        response = nlp_processor.get_response(message.text)
+        response = await nlp_service.get_response(message.text)
         await message.answer(response)
@@ -0,0 +1,218 @@
+import io
+import os
+import sys
+import gzip
+import time
+import shutil
+import atexit
+import logging
+import multiprocessing
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+
+from config import LOG_MODE, LOG_DEDUP_WINDOW, LOG_DEBUG_RATE, LOG_COMPRESS_ROTATED
+
+# Логгер нераспознанных слов: пишется только в unrecognized.log, в bot.log и консоль не попадает
+UNRECOGNIZED_LOGGER = "unrecognized"
+# Сколько разных сообщений держать в окне подавления повторов
+MAX_TRACKED_MESSAGES = 10000
+
+# Очередь записей и поток, который передаёт их обработчикам (режим "queue")
+_queue = None
+_listener = None
+
+
+def setup_utf8_stdio():
+    # Устанавливка стандартные потоки ввода-вывода в UTF-8
+    sys.stdin = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+
+def _gzip_namer(name):
+    return name + ".gz"
+
+
+def _gzip_rotator(source, dest):
+    #Ротированный файл сразу сжимается: bot.log -> bot.log.1.gz
+    with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+def _rotating_handler(filename):
+    handler = RotatingFileHandler(filename, maxBytes=5*1024*1024, backupCount=5, encoding='utf-8')
+    if LOG_COMPRESS_ROTATED:
+        handler.namer = _gzip_namer
+        handler.rotator = _gzip_rotator
+    return handler
+
+
+class DebugRateLimit(logging.Filter):
+    #Не больше rate DEBUG-записей в секунду с одним шаблоном сообщения, остальные отбрасываются.
+    #Шаблон - это record.msg до подстановки аргументов, т.е. одна строка кода с logging.debug
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+        self.counters = {}
+        self.dropped = 0
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        second = int(record.created)
+        counter = self.counters.get(record.msg)
+        if counter is None or counter[0] != second:
+            if len(self.counters) >= MAX_TRACKED_MESSAGES:
+                self.counters.clear()
+            self.counters[record.msg] = [second, 1]
+            return True
+        if counter[1] >= self.rate:
+            self.dropped += 1
+            return False
+        counter[1] += 1
+        return True
+
+
+class DedupHandler(logging.Handler):
+    #Передаёт записи обработчикам, пропуская повторы: одинаковое сообщение пишется один раз
+    #за окно window секунд, а по окончании окна выводится одна строка с числом повторов.
+    #Окно закрывается при первой записи после его конца или при завершении работы.
+    #WARNING и выше, а также записи с трассировкой исключения пишутся всегда
+
+    def __init__(self, handlers, window):
+        super().__init__()
+        self.handlers = handlers
+        self.window = window
+        self.window_started = time.time()
+        # (логгер, уровень, текст) -> [первая запись, число подавленных повторов]
+        self.repeats = {}
+
+    def emit(self, record):
+        if record.created - self.window_started >= self.window:
+            self.flush_repeats()
+            self.window_started = record.created
+        if record.levelno >= logging.WARNING or record.exc_info:
+            self._dispatch(record)
+            return
+        key = (record.name, record.levelno, record.getMessage())
+        seen = self.repeats.get(key)
+        if seen is not None:
+            seen[1] += 1
+            return
+        if len(self.repeats) < MAX_TRACKED_MESSAGES:
+            self.repeats[key] = [record, 0]
+        self._dispatch(record)
+
+    def _dispatch(self, record):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def flush_repeats(self):
+        repeats, self.repeats = self.repeats, {}
+        for record, count in repeats.values():
+            if count:
+                summary = logging.makeLogRecord(record.__dict__)
+                summary.msg = "%s [repeated %d more times in %.0fs]"
+                summary.args = (record.getMessage(), count, self.window)
+                summary.exc_info = summary.exc_text = None
+                summary.created = time.time()
+                summary.msecs = (summary.created - int(summary.created)) * 1000
+                self._dispatch(summary)
+
+    def flush(self):
+        for handler in self.handlers:
+            handler.flush()
+
+    def close(self):
+        self.acquire()
+        try:
+            self.flush_repeats()
+        finally:
+            self.release()
+        super().close()
+
+
+def _build_handlers():
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+
+    # Обработчики с явным указанием кодировки UTF-8
+    handlers = [
+        _rotating_handler('bot.log'),
+        _rotating_handler('unrecognized.log'),
+        logging.StreamHandler(sys.stdout)  # Используем sys.stdout с UTF-8
+    ]
+
+    handlers[0].setLevel(logging.DEBUG)
+    handlers[1].setLevel(logging.INFO)
+    handlers[2].setLevel(logging.INFO)
+
+    # unrecognized.log получает только записи своего логгера, остальные - все, кроме них
+    only_unrecognized = logging.Filter(UNRECOGNIZED_LOGGER)
+    handlers[1].addFilter(only_unrecognized)
+    for handler in (handlers[0], handlers[2]):
+        handler.addFilter(lambda record: not only_unrecognized.filter(record))
+
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    if LOG_DEDUP_WINDOW > 0:
+        return [DedupHandler(handlers, LOG_DEDUP_WINDOW)]
+    return handlers
+
+
+def _attach(handler):
+    #Подключает обработчик к корневому логгеру и логгеру нераспознанных слов
+    if LOG_DEBUG_RATE > 0:
+        # Лишние DEBUG-записи отбрасываются до форматирования и постановки в очередь
+        handler.addFilter(DebugRateLimit(LOG_DEBUG_RATE))
+    logging.getLogger().addHandler(handler)
+    unrecognized = logging.getLogger(UNRECOGNIZED_LOGGER)
+    unrecognized.propagate = False
+    unrecognized.addHandler(handler)
+
+
+# Настройка логирования с UTF-8
+def setup_logging(mode=LOG_MODE):
+    global _queue, _listener
+    logger = logging.getLogger()
+    logger.setLevel(logging.DEBUG)
+
+    handlers = _build_handlers()
+    if mode != "queue":
+        for handler in handlers:
+            _attach(handler)
+        return
+
+    # Очередь межпроцессная: в неё же пишут рабочие процессы пула NLP, поэтому файлы логов
+    # открыты только в основном процессе и ротация не портит записи других процессов
+    _queue = multiprocessing.Queue(-1)
+    _listener = QueueListener(_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    _attach(QueueHandler(_queue))
+    atexit.register(stop_logging)
+
+
+def log_queue():
+    #Очередь основного процесса для рабочих процессов (None в режиме "direct")
+    return _queue
+
+
+def setup_worker_logging(queue):
+    #Рабочий процесс отправляет записи в очередь основного процесса вместо своих обработчиков
+    logger = logging.getLogger()
+    # При fork процесс наследует обработчики основного, их записи шли бы мимо очереди
+    for name in (None, UNRECOGNIZED_LOGGER):
+        inherited = logging.getLogger(name)
+        for handler in inherited.handlers[:]:
+            inherited.removeHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    _attach(QueueHandler(queue))
+
+
+def stop_logging():
+    #Дописывает оставшиеся в очереди записи и останавливает фоновый поток
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
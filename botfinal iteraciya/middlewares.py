@@ -0,0 +1,40 @@
+import logging
+
+from aiogram import BaseMiddleware
+
+from repositories import repositories
+
+
+class DatabaseMiddleware(BaseMiddleware):
+    #Передаёт обработчику доступ к базе (аргумент db): репозитории пользователей, роутеров,
+    #тарифов и обратной связи. Запросы выполняются в пуле потоков на переиспользуемых
+    #соединениях, обработчик только ждёт результат через await.
+
+    def __init__(self, db=repositories):
+        self.db = db
+
+    async def __call__(self, handler, event, data):
+        data["db"] = self.db
+        return await handler(event, data)
+
+
+class AuthMiddleware(BaseMiddleware):
+    #Определяет роль автора обновления один раз и передаёт её обработчику (аргумент role):
+    #ROLE_ADMIN, ROLE_USER или None, если пользователя нет в базе. Роль берётся из кэша ролей,
+    #в базу идёт только промах кэша. Регистрируется после DatabaseMiddleware
+
+    def __init__(self, db=repositories):
+        self.db = db
+
+    async def __call__(self, handler, event, data):
+        # event_from_user заполняет встроенный UserContextMiddleware aiogram
+        user = data.get("event_from_user")
+        role = None
+        if user is not None:
+            try:
+                role = await self.db.users.get_role(user.id)
+            except Exception as e:
+                # Как и раньше, при ошибке базы права администратора не выдаются
+                logging.error(f"Error resolving role for user {user.id}: {e}")
+        data["role"] = role
+        return await handler(event, data)
@@ -0,0 +1,393 @@
+import asyncio
+import sqlite3
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import DB_POOL_SIZE, DB_COMMIT_LATENCY, DB_WRITE_BATCH_MAX
+from config import ROLE_CACHE_TTL, ROLE_CACHE_ADMIN_TTL, ROLE_CACHE_NEGATIVE_TTL, ROLE_CACHE_MAX
+from database import database
+import utils
+from request import request_admin
+
+
+class DatabaseExecutor:
+    #Пул потоков для запросов к базе: обработчики ждут результат через await,
+    #а цикл событий тем временем обслуживает другие чаты.
+    #Каждый поток пула работает со своим переиспользуемым соединением (database.py).
+
+    def __init__(self, db=database, workers=DB_POOL_SIZE):
+        self.db = db
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db")
+
+    async def run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._call, func, args)
+
+    def _call(self, func, args):
+        try:
+            return func(*args)
+        except Exception:
+            # Незавершённая транзакция не должна попасть в следующий запрос этого потока
+            conn = self.db.connection()
+            if conn.in_transaction:
+                logging.warning("Rolling back unfinished SQLite transaction after %s", func.__name__)
+                conn.rollback()
+            raise
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+class DatabaseWriter:
+    #Единственный писатель базы: все изменения идут через одну задачу и один поток,
+    #поэтому записи не конкурируют за блокировку ("database is locked").
+    #Ожидающие записи объединяются в одну транзакцию (group commit): каждая выполняется в своей
+    #точке сохранения, ошибка одной откатывает только её. Вызывающий получает результат после commit.
+
+    def __init__(self, db=database, latency=DB_COMMIT_LATENCY, max_batch=DB_WRITE_BATCH_MAX):
+        self.db = db
+        self.latency = latency
+        self.max_batch = max_batch
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db_writer")
+        self._queue = None
+        self._task = None
+        self.stats = {"writes": 0, "failed": 0, "commits": 0, "max_batch_size": 0}
+
+    async def submit(self, func, *args):
+        #Выполняет func(*args) в транзакции писателя и возвращает её результат после commit
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            # Задача запускается при первой записи в цикле событий бота
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+        future = loop.create_future()
+        self._queue.put_nowait((func, args, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            # Собираем записи, пришедшие за время ожидания commit
+            deadline = loop.time() + self.latency
+            while len(batch) < self.max_batch:
+                if self._queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    item = self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                results = await loop.run_in_executor(self.executor, self._write_batch,
+                                                     [(func, args) for func, args, _ in batch])
+            except asyncio.CancelledError:
+                for _, _, future in batch:
+                    future.cancel()
+                raise
+            except BaseException as e:
+                # Писатель продолжает работать, а ожидающие записи не должны зависнуть навсегда
+                logging.error(f"Database writer failed on a batch of {len(batch)}: {e!r}", exc_info=True)
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, _, future), (ok, value) in zip(batch, results):
+                # Вызывающий мог перестать ждать (таймаут), запись при этом уже выполнена
+                if future.done():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    def _write_batch(self, operations):
+        conn = self.db.connection()
+        # Транзакциями соединения писателя управляет только он
+        conn.isolation_level = None
+        results = []
+        try:
+            if conn.in_transaction:
+                # Остаток транзакции, которую не удалось откатить в прошлый раз
+                conn.execute("ROLLBACK")
+            conn.execute("BEGIN IMMEDIATE")
+            for func, args in operations:
+                conn.execute("SAVEPOINT write")
+                try:
+                    results.append((True, func(*args)))
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write")
+                    results.append((False, e))
+                conn.execute("RELEASE write")
+            conn.execute("COMMIT")
+        except Exception as e:
+            logging.error(f"Database write batch of {len(operations)} failed: {e}", exc_info=True)
+            if conn.in_transaction:
+                try:
+                    conn.execute("ROLLBACK")
+                except sqlite3.Error as rollback_error:
+                    logging.error(f"Rollback of the failed write batch failed: {rollback_error}")
+            self.stats["failed"] += len(operations)
+            return [(False, e)] * len(operations)
+        self.stats["writes"] += len(operations)
+        self.stats["failed"] += sum(not ok for ok, _ in results)
+        self.stats["commits"] += 1
+        self.stats["max_batch_size"] = max(self.stats["max_batch_size"], len(operations))
+        return results
+
+    async def close(self):
+        #Дописывает всё, что уже в очереди, и останавливает писателя
+        if self._task is not None and not self._task.done():
+            self._queue.put_nowait(None)
+            await self._task
+        self.executor.shutdown(wait=True)
+
+
+class CatalogCache:
+    #Роутеры и тарифы в памяти: каталог меняется несколько раз в месяц, а читается при каждом
+    #нажатии кнопки. Перед выдачей проверяется PRAGMA data_version соединения - она меняется,
+    #только если другое соединение (писатель этого бота или другой процесс) сделало commit.
+    #Тогда читается номер версии каталога (catalog_version), и каталог перечитывается,
+    #только если номер изменился. Списки общие для всех вызывающих, изменять их нельзя.
+
+    def __init__(self, db=database):
+        self.db = db
+        self.version = None
+        self.routers = []
+        self.tariffs = []
+        self._lock = threading.Lock()
+        # data_version, которую соединение этого потока видело при последней проверке
+        self._local = threading.local()
+        self.stats = {"hits": 0, "version_checks": 0, "reloads": 0}
+
+    def _fresh(self):
+        #Вызывается в потоке пула базы
+        data_version = self.db.connection().execute("PRAGMA data_version").fetchone()[0]
+        if self.version is not None and data_version == getattr(self._local, "data_version", None):
+            # Счётчики общие для всех потоков пула, поэтому меняются только под блокировкой
+            with self._lock:
+                self.stats["hits"] += 1
+            return
+        with self._lock:
+            self.stats["version_checks"] += 1
+            version = utils.get_catalog_version()
+            if version != self.version:
+                # Версия читается раньше данных, поэтому данные не старее версии
+                self.routers = request_admin.get_all_routers()
+                self.tariffs = request_admin.get_all_tariffs()
+                self.version = version
+                self.stats["reloads"] += 1
+                logging.debug("Catalog reloaded: version %d, %d routers, %d tariffs",
+                              version, len(self.routers), len(self.tariffs))
+        self._local.data_version = data_version
+
+    def get_routers(self):
+        self._fresh()
+        return self.routers
+
+    def get_tariffs(self):
+        self._fresh()
+        return self.tariffs
+
+
+class RoleCache:
+    #Роли пользователей и список администраторов в памяти. Запись о роли живёт ttl секунд,
+    #запись администратора и список администраторов - admin_ttl (снятые вручную права не должны
+    #действовать долго), запись о незнакомом пользователе (роль None) - negative_ttl, чтобы
+    #повторные сообщения незнакомцев тоже не шли в базу. Добавление пользователя сбрасывает его запись.
+    #Используется только из цикла событий, поэтому без блокировок
+
+    MISSING = object()
+
+    def __init__(self, ttl=ROLE_CACHE_TTL, admin_ttl=ROLE_CACHE_ADMIN_TTL, negative_ttl=ROLE_CACHE_NEGATIVE_TTL,
+                 max_size=ROLE_CACHE_MAX):
+        self.ttl = ttl
+        self.admin_ttl = admin_ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        # user_id -> (роль, момент устаревания по time.monotonic())
+        self.roles = {}
+        self.admin_ids = None
+        self.admin_ids_expires = 0.0
+        # Растёт при каждом сбросе: результат запроса, начатого до сброса, в кэш не кладётся
+        self.generation = 0
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, user_id):
+        #Роль из кэша или MISSING, если записи нет или она устарела
+        entry = self.roles.get(user_id)
+        if entry is not None and entry[1] > time.monotonic():
+            self.stats["hits"] += 1
+            return entry[0]
+        self.stats["misses"] += 1
+        return self.MISSING
+
+    def put(self, user_id, role, generation):
+        if generation != self.generation:
+            return
+        previous = self.roles.get(user_id)
+        if previous is not None and (previous[0] == utils.ROLE_ADMIN) != (role == utils.ROLE_ADMIN):
+            # Права изменили в базе вручную - список администраторов тоже устарел
+            self.admin_ids = None
+        if user_id not in self.roles and len(self.roles) >= self.max_size:
+            self._prune()
+        if role == utils.ROLE_ADMIN:
+            ttl = self.admin_ttl
+        elif role is None:
+            ttl = self.negative_ttl
+        else:
+            ttl = self.ttl
+        self.roles[user_id] = (role, time.monotonic() + ttl)
+
+    def _prune(self):
+        now = time.monotonic()
+        self.roles = {user_id: entry for user_id, entry in self.roles.items() if entry[1] > now}
+        if len(self.roles) >= self.max_size:
+            self.roles.clear()
+
+    def get_admin_ids(self):
+        #Список ID администраторов или None, если его нужно перечитать
+        if self.admin_ids is not None and self.admin_ids_expires > time.monotonic():
+            return self.admin_ids
+        return None
+
+    def put_admin_ids(self, admin_ids, generation):
+        if generation == self.generation:
+            self.admin_ids = admin_ids
+            self.admin_ids_expires = time.monotonic() + self.admin_ttl
+
+    def invalidate(self, user_id=None):
+        #Сбрасывает роль пользователя (или все роли) и список администраторов
+        self.generation += 1
+        if user_id is None:
+            self.roles.clear()
+        else:
+            self.roles.pop(user_id, None)
+        self.admin_ids = None
+
+
+class UsersRepository:
+    def __init__(self, executor, writer, roles):
+        self.executor = executor
+        self.writer = writer
+        self.roles = roles
+
+    async def get(self, user_id):
+        return await self.executor.run(utils.get_user, user_id)
+
+    async def add(self, user_id, username, fio):
+        await self.writer.submit(utils.add_user, user_id, username, fio)
+        # Отрицательная запись о новом пользователе больше не верна
+        self.roles.invalidate(user_id)
+
+    async def get_role(self, user_id):
+        #utils.ROLE_ADMIN, utils.ROLE_USER или None, если пользователя нет в базе
+        role = self.roles.get(user_id)
+        if role is RoleCache.MISSING:
+            generation = self.roles.generation
+            role = await self.executor.run(utils.get_user_role, user_id)
+            self.roles.put(user_id, role, generation)
+        return role
+
+    async def get_admin_ids(self):
+        admin_ids = self.roles.get_admin_ids()
+        if admin_ids is None:
+            generation = self.roles.generation
+            admin_ids = await self.executor.run(utils.get_admin_ids)
+            self.roles.put_admin_ids(admin_ids, generation)
+        return admin_ids
+
+
+class RoutersRepository:
+    def __init__(self, executor, writer, catalog):
+        self.executor = executor
+        self.writer = writer
+        self.catalog = catalog
+
+    async def get_all(self):
+        return await self.executor.run(self.catalog.get_routers)
+
+    async def get_by_id(self, router_id):
+        return await self.executor.run(utils.get_router_by_id, router_id)
+
+    async def add(self, data):
+        await self.writer.submit(utils.add_router_to_db, data)
+
+    async def update(self, router_id, data):
+        return await self.writer.submit(utils.update_router_in_db, router_id, data)
+
+    async def delete(self, router_id):
+        return await self.writer.submit(utils.delete_router_from_db, router_id)
+
+
+class TariffsRepository:
+    def __init__(self, executor, writer, catalog):
+        self.executor = executor
+        self.writer = writer
+        self.catalog = catalog
+
+    async def get_all(self):
+        return await self.executor.run(self.catalog.get_tariffs)
+
+    async def get_by_id(self, tariff_id):
+        return await self.executor.run(utils.get_tarifs_by_id, tariff_id)
+
+    async def add(self, data):
+        await self.writer.submit(utils.add_tariff_to_db, data)
+
+    async def update(self, tariff_id, data):
+        return await self.writer.submit(utils.update_tariff_in_db, tariff_id, data)
+
+    async def delete(self, tariff_id):
+        return await self.writer.submit(utils.delete_tariff_from_db, tariff_id)
+
+
+class FeedbackRepository:
+    def __init__(self, executor, writer):
+        self.executor = executor
+        self.writer = writer
+
+    async def add(self, user_id, username, text):
+        await self.writer.submit(utils.add_feedback_to_db, user_id, username, text)
+
+    async def reply(self, user_id, admin_id, reply_text, status):
+        #Число сообщений пользователя, отмеченных ответом
+        return await self.writer.submit(utils.reply_feedback_in_db, user_id, admin_id, reply_text, status)
+
+    async def get_new(self, limit=50):
+        return await self.executor.run(utils.get_new_feedback, limit)
+
+
+class Repositories:
+    #Асинхронный доступ к базе бота для обработчиков (передаётся им как аргумент db)
+
+    def __init__(self, db=database, workers=DB_POOL_SIZE):
+        self.executor = DatabaseExecutor(db, workers)
+        self.writer = DatabaseWriter(db)
+        self.catalog = CatalogCache(db)
+        self.roles = RoleCache()
+        self.users = UsersRepository(self.executor, self.writer, self.roles)
+        self.routers = RoutersRepository(self.executor, self.writer, self.catalog)
+        self.tariffs = TariffsRepository(self.executor, self.writer, self.catalog)
+        self.feedback = FeedbackRepository(self.executor, self.writer)
+
+    async def close(self):
+        # Сначала дописываем очередь записей, затем останавливаем чтение
+        await self.writer.close()
+        self.executor.close()
+
+
+repositories = Repositories()
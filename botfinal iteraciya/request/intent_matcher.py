@@ -0,0 +1,156 @@
+import re
+import logging
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+# Модуль regex умеет прерывать сопоставление по таймауту, re - нет
+try:
+    import regex
+except ImportError:
+    regex = None
+
+from request.linear_pattern import compile_linear, backtracking_risk, fold_sensitive_chars
+
+
+# Минимальная длина литерала, который имеет смысл использовать как якорь
+MIN_ANCHOR_LENGTH = 2
+# Сколько секунд может идти сопоставление шаблона, который нельзя проверить за линейное время
+REGEX_TIMEOUT = 0.05
+
+
+def extract_anchors(pattern):
+    #Возвращает литералы, без которых шаблон не может совпасть (в нижнем регистре).
+    #Альтернативы (a|b) и повторения якорей не дают, в них литерал не обязателен.
+    try:
+        parsed = sre_parse.parse(pattern, re.IGNORECASE)
+    except re.error:
+        return []
+    anchors = []
+    _collect_anchors(parsed, anchors)
+    return [anchor.lower() for anchor in anchors if len(anchor) >= MIN_ANCHOR_LENGTH]
+
+
+def _collect_anchors(items, anchors):
+    run = []
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            run.append(chr(av))
+            continue
+        if run:
+            anchors.append("".join(run))
+            run = []
+        if op is sre_parse.SUBPATTERN:
+            # Группа без альтернатив обязана совпасть целиком
+            _collect_anchors(av[-1], anchors)
+    if run:
+        anchors.append("".join(run))
+
+
+def _compile_budgeted(pattern):
+    #Шаблон для сопоставления с ограничением времени (если установлен regex)
+    if regex is not None:
+        try:
+            return regex.compile(pattern, regex.IGNORECASE | regex.VERSION0)
+        except regex.error:
+            pass
+    return re.compile(pattern, re.IGNORECASE)
+
+
+class IntentMatcher:
+    #Предкомпилированные шаблоны базы знаний с привязкой к номеру категории.
+    #Перед запуском регулярного выражения шаблон отсекается по обязательным литералам.
+    #Шаблоны вида (.*)лит1(.*)лит2(.*) проверяются поиском подстрок за линейное время,
+    #остальные - регулярным выражением с таймаутом REGEX_TIMEOUT.
+
+    def __init__(self, knowledge_base):
+        self.entries = []
+        self.categories = set()
+        self.risky_patterns = []
+        pattern_chars = set()
+        for category_id, category in enumerate(knowledge_base):
+            for pattern in category["patterns"]:
+                try:
+                    re.compile(pattern, re.IGNORECASE)
+                except re.error as e:
+                    logging.error(f"Pattern compile error for '{pattern}': {e}")
+                    continue
+                risk = backtracking_risk(pattern)
+                if risk:
+                    # Такой шаблон может перебирать варианты экспоненциально долго
+                    logging.warning(f"Pattern '{pattern}' in category {category_id} "
+                                    f"risks catastrophic backtracking: {risk}")
+                    self.risky_patterns.append((category_id, pattern, risk))
+                linear = compile_linear(pattern)
+                if linear is not None:
+                    pattern_chars |= linear.chars
+                self.entries.append((category_id, _compile_budgeted(pattern), linear, extract_anchors(pattern)))
+                self.categories.add(category_id)
+        self.fold_sensitive = fold_sensitive_chars(pattern_chars)
+        if regex is None:
+            logging.warning("Module 'regex' is not installed, regex patterns run without a time limit")
+        self.reset_stats()
+        linear_count = sum(1 for entry in self.entries if entry[2] is not None)
+        logging.debug(f"Intent matcher compiled {len(self.entries)} patterns for {len(self.categories)} categories, "
+                      f"{linear_count} linear-time")
+
+    def reset_stats(self):
+        self.stats = {
+            "messages": 0,
+            "regex_runs": 0,
+            "anchor_rejections": 0,
+            "matches": 0,
+            "last_regex_runs": 0,
+            "linear_runs": 0,
+            "regex_timeouts": 0,
+        }
+
+    def _budgeted_fullmatch(self, compiled, text):
+        if regex is None:
+            return compiled.fullmatch(text) is not None
+        try:
+            return compiled.fullmatch(text, timeout=REGEX_TIMEOUT) is not None
+        except TimeoutError:
+            self.stats["regex_timeouts"] += 1
+            logging.warning("Pattern '%s' timed out after %ss on text of %d chars",
+                            compiled.pattern, REGEX_TIMEOUT, len(text))
+            return False
+
+    def first_match(self, text):
+        #Номер первой по порядку категории, чей шаблон полностью совпал с текстом, или None
+        lowered = text.lower()
+        # Линейная проверка равносильна re.fullmatch, только если в тексте одна строка, из пробельных
+        # символов только пробел, а регистр меняется посимвольно, как в re.IGNORECASE
+        linear_ok = (len(lowered) == len(text) and lowered.isprintable()
+                     and self.fold_sensitive.isdisjoint(lowered))
+        regex_runs = 0
+        linear_runs = 0
+        match = None
+        for category_id, compiled, linear, anchors in self.entries:
+            if not all(anchor in lowered for anchor in anchors):
+                self.stats["anchor_rejections"] += 1
+                continue
+            if linear is not None and linear_ok:
+                linear_runs += 1
+                matched = linear.fullmatch(lowered)
+            else:
+                regex_runs += 1
+                matched = self._budgeted_fullmatch(compiled, text)
+            if matched:
+                match = category_id
+                self.stats["matches"] += 1
+                break
+        self.stats["messages"] += 1
+        self.stats["regex_runs"] += regex_runs
+        self.stats["linear_runs"] += linear_runs
+        self.stats["last_regex_runs"] = regex_runs
+        logging.debug("Intent matcher ran %d regexes and %d linear checks, match: %s", regex_runs, linear_runs, match)
+        return match
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        messages = stats["messages"]
+        stats["regex_runs_per_message"] = stats["regex_runs"] / messages if messages else 0.0
+        return stats
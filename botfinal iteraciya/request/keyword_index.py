@@ -0,0 +1,50 @@
+import logging
+
+
+class KeywordIndex:
+    #Обратный индекс: лемма ключевого слова -> категории, в которых оно встречается.
+    #Леммы ключевых слов считаются один раз при загрузке базы знаний.
+
+    def __init__(self, knowledge_base, nlp):
+        self.index = {}
+        self.keyword_counts = []
+        # Общий словарь для исправления опечаток
+        self.dictionary = set(kw for cat in knowledge_base for kw in cat.get("keywords", []))
+
+        keywords = sorted(self.dictionary)
+        self.lemmas = {keyword: doc[0].lemma_ for keyword, doc in zip(keywords, nlp.pipe(keywords))}
+
+        for category_id, category in enumerate(knowledge_base):
+            category_keywords = category.get("keywords", [])
+            self.keyword_counts.append(len(category_keywords))
+            for keyword in category_keywords:
+                postings = self.index.setdefault(self.lemmas[keyword], {})
+                postings[category_id] = postings.get(category_id, 0) + 1
+        logging.debug(f"Keyword index built: {len(self.index)} lemmas, {len(self.dictionary)} keywords")
+
+    def scores(self, tokens):
+        #Оценки (от 0 до 1) только для категорий, ключевые слова которых есть в сообщении
+        matched = {}
+        for token in set(tokens):
+            for category_id, count in self.index.get(token, {}).items():
+                matched[category_id] = matched.get(category_id, 0) + count
+        return {
+            category_id: min(1.0, count / self.keyword_counts[category_id])
+            for category_id, count in matched.items()
+        }
+
+    def best_match(self, tokens, before=None, categories=None):
+        #Лучшая категория (номер, оценка) среди категорий с номером меньше before;
+        #при равенстве побеждает категория с меньшим номером
+        scores = self.scores(tokens)
+        best_match = None
+        best_score = 0
+        for category_id in sorted(scores):
+            if before is not None and category_id >= before:
+                break
+            if categories is not None and category_id not in categories:
+                continue
+            if scores[category_id] > best_score:
+                best_score = scores[category_id]
+                best_match = category_id
+        return best_match, best_score
@@ -0,0 +1,53 @@
+#База знаний с регулярными выражениями и ключевыми словами хранится в knowledge_base.json,
+#её можно править без изменения кода и перезагружать на ходу (команда /reload_kb).
+#Модуль не зависит от spaCy, поэтому шаблоны доступны сразу при старте бота.
+import os
+import re
+import json
+from pathlib import Path
+
+KNOWLEDGE_BASE_PATH = Path(__file__).with_name("knowledge_base.json")
+# Ответ, если категория не найдена
+UNRECOGNIZED_RESPONSE = "Извините, я не понял. Уточните вопрос?"
+
+
+def _check_strings(category_id, category, field, required):
+    values = category.get(field, [])
+    if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+        raise ValueError(f"Category {category_id}: '{field}' must be a list of strings")
+    if required and not values:
+        raise ValueError(f"Category {category_id}: '{field}' must not be empty")
+
+
+def load_knowledge_base(path=KNOWLEDGE_BASE_PATH):
+    #Читает и проверяет базу знаний; при ошибке бросает ValueError, прежняя база остаётся в работе
+    try:
+        with open(path, encoding="utf-8") as f:
+            knowledge_base = json.load(f)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON in {path}: {e}") from e
+    except (OSError, UnicodeDecodeError) as e:
+        raise ValueError(f"Cannot read {path}: {e}") from e
+    if not isinstance(knowledge_base, list) or not knowledge_base:
+        raise ValueError(f"{path} must contain a non-empty list of categories")
+    for category_id, category in enumerate(knowledge_base):
+        if not isinstance(category, dict):
+            raise ValueError(f"Category {category_id} must be an object")
+        category.setdefault("patterns", [])
+        _check_strings(category_id, category, "patterns", False)
+        for pattern in category["patterns"]:
+            try:
+                re.compile(pattern, re.IGNORECASE)
+            except re.error as e:
+                raise ValueError(f"Category {category_id}: bad pattern '{pattern}': {e}") from e
+        _check_strings(category_id, category, "keywords", False)
+        _check_strings(category_id, category, "responses", True)
+    return knowledge_base
+
+
+def knowledge_base_version(path=KNOWLEDGE_BASE_PATH):
+    #Время изменения файла базы знаний, по нему видно, что файл поменялся
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
@@ -0,0 +1,25 @@
+import logging
+from request.intent_matcher import IntentMatcher
+from request.keyword_index import KeywordIndex
+
+
+class KnowledgeIndex:
+    #Всё, что строится из базы знаний: шаблоны, индекс ключевых слов и оценщик категорий.
+    #Объект собирается целиком и только потом подменяет прежний одним присваиванием,
+    #поэтому обрабатываемые сообщения никогда не видят наполовину построенный индекс.
+
+    def __init__(self, knowledge_base, nlp, engine="index", ngram_weight=0.0, version=None):
+        self.knowledge_base = knowledge_base
+        self.version = version
+        # Обратный индекс ключевых слов с заранее посчитанными леммами
+        self.keyword_index = KeywordIndex(knowledge_base, nlp)
+        # Оценщик категорий по ключевым словам: обратный индекс или матрица признаков numpy
+        if engine == "vector":
+            from request.vector_engine import VectorIntentEngine
+            self.intent_engine = VectorIntentEngine(knowledge_base, self.keyword_index.lemmas,
+                                                    ngram_weight=ngram_weight)
+        else:
+            self.intent_engine = self.keyword_index
+        # Все шаблоны компилируются заранее и привязываются к номеру категории
+        self.intent_matcher = IntentMatcher(knowledge_base)
+        logging.debug(f"Knowledge index built: {len(knowledge_base)} categories")
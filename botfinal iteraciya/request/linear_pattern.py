@@ -0,0 +1,211 @@
+import re
+
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+try:
+    from re._casefix import _EXTRA_CASES
+except ImportError:  # Python < 3.11
+    _EXTRA_CASES = {}
+
+
+# Сколько вариантов строки допускается при раскрытии соседних альтернатив (a|b)(c|d)
+MAX_ALTERNATIVES = 256
+
+# Пропуск "любые символы" на месте (.*) в разобранном шаблоне
+_GAP = None
+
+
+class LinearPattern:
+    #Шаблон вида (.*)лит1(.*)(лит2|лит3)(.*)... без возвратов: полное совпадение проверяется
+    #последовательным поиском подстрок, каждая ищется с конца предыдущей, за линейное время.
+    #Работает с текстом в нижнем регистре, без переводов строк и пробельных символов кроме пробела:
+    #тогда \s в шаблоне - это ровно пробел, а . совпадает с любым символом.
+
+    def __init__(self, segments, leading_gap, trailing_gap):
+        # segments - список кортежей строк-альтернатив; между соседними сегментами всегда пропуск
+        self.segments = segments
+        self.leading_gap = leading_gap
+        self.trailing_gap = trailing_gap
+        self.chars = set("".join(alternative for segment in segments for alternative in segment))
+
+    def fullmatch(self, lowered):
+        length = len(lowered)
+        position = 0
+        last = len(self.segments) - 1
+        for number, alternatives in enumerate(self.segments):
+            anchored = number == 0 and not self.leading_gap
+            if number == last and not self.trailing_gap:
+                # Последний сегмент должен закончиться ровно в конце текста
+                for alternative in alternatives:
+                    start = length - len(alternative)
+                    if start >= position and (not anchored or start == position) \
+                            and lowered.endswith(alternative):
+                        return True
+                return False
+            # Из всех вхождений берётся то, что раньше всех заканчивается: остаток текста
+            # для следующих сегментов тогда самый длинный, и совпадение не может быть упущено
+            best_end = None
+            for alternative in alternatives:
+                if anchored:
+                    start = position if lowered.startswith(alternative, position) else -1
+                else:
+                    start = lowered.find(alternative, position)
+                if start >= 0 and (best_end is None or start + len(alternative) < best_end):
+                    best_end = start + len(alternative)
+            if best_end is None:
+                return False
+            position = best_end
+        return self.trailing_gap or position == length
+
+
+def _is_gap(op, av):
+    # .* (жадный или ленивый) без флагов DOTALL
+    return (op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT)
+            and av[0] == 0 and av[1] == sre_constants.MAXREPEAT
+            and list(av[2]) == [(sre_constants.ANY, None)])
+
+
+def _flatten(items):
+    #Разобранный шаблон -> список из пропусков (_GAP) и множеств строк; None, если так нельзя
+    result = []
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            result.append({chr(av).lower()})
+        elif op is sre_constants.IN:
+            # Классы из отдельных символов: так sre_parse хранит и альтернативы вида (a|b)
+            chars = set()
+            for item_op, item_av in av:
+                if item_op is sre_constants.LITERAL:
+                    chars.add(chr(item_av).lower())
+                elif item_op is sre_constants.CATEGORY and item_av is sre_constants.CATEGORY_SPACE:
+                    chars.add(" ")
+                else:
+                    return None
+            result.append(chars)
+        elif _is_gap(op, av):
+            result.append(_GAP)
+        elif op is sre_constants.SUBPATTERN:
+            _, add_flags, del_flags, body = av
+            if add_flags or del_flags:
+                return None
+            inner = _flatten(body)
+            if inner is None:
+                return None
+            result.extend(inner)
+        elif op is sre_constants.BRANCH:
+            alternatives = set()
+            for branch in av[1]:
+                inner = _flatten(branch)
+                if inner is None or _GAP in inner:
+                    return None
+                alternatives |= _product(inner)
+                if len(alternatives) > MAX_ALTERNATIVES:
+                    return None
+            result.append(alternatives)
+        else:
+            return None
+    return result
+
+
+def _product(parts):
+    strings = {""}
+    for part in parts:
+        strings = {prefix + suffix for prefix in strings for suffix in part}
+        if len(strings) > MAX_ALTERNATIVES:
+            return strings
+    return strings
+
+
+def compile_linear(pattern):
+    #LinearPattern для шаблона из литералов, \s, альтернатив литералов и (.*); иначе None
+    try:
+        parsed = sre_parse.parse(pattern, re.IGNORECASE)
+    except re.error:
+        return None
+    items = _flatten(parsed)
+    if items is None:
+        return None
+    # Соседние литералы склеиваются, соседние пропуски схлопываются
+    segments = []
+    leading_gap = trailing_gap = False
+    current = None
+    for item in items:
+        if item is _GAP:
+            if current is not None:
+                segments.append(current)
+                current = None
+            elif not segments:
+                leading_gap = True
+            trailing_gap = True
+            continue
+        trailing_gap = False
+        current = _product([current, item]) if current is not None else set(item)
+        if len(current) > MAX_ALTERNATIVES:
+            return None
+    if current is not None:
+        segments.append(current)
+    if not segments:
+        # Шаблон из одних пропусков (.*) совпадает с любым текстом в одну строку
+        return LinearPattern([], True, True) if leading_gap else LinearPattern([("",)], False, False)
+    return LinearPattern([tuple(sorted(segment)) for segment in segments], leading_gap, trailing_gap)
+
+
+def fold_sensitive_chars(chars):
+    #Символы текста, которые re.IGNORECASE считает равными этим символам, хотя lower() у них другой
+    #(например, 'ı' и 'i'); при их наличии в тексте линейная проверка не применяется
+    sensitive = set()
+    for code, equivalents in _EXTRA_CASES.items():
+        if any(chr(equivalent) in chars for equivalent in equivalents):
+            sensitive.add(chr(code))
+    return sensitive
+
+
+def _unbounded(op, av):
+    return op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[1] == sre_constants.MAXREPEAT
+
+
+def _contains_repeat_or_branch(items):
+    for op, av in items:
+        if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[1] > 1:
+            return "nested quantifier"
+        if op is sre_constants.BRANCH:
+            return "quantified alternation"
+        if op is sre_constants.SUBPATTERN:
+            reason = _contains_repeat_or_branch(av[-1])
+            if reason:
+                return reason
+    return None
+
+
+def backtracking_risk(pattern):
+    #Причина риска экспоненциального перебора ((a+)+, (a|aa)* и т.п.) или None
+    try:
+        parsed = sre_parse.parse(pattern, re.IGNORECASE)
+    except re.error:
+        return None
+    return _find_risk(parsed)
+
+
+def _find_risk(items):
+    for op, av in items:
+        if _unbounded(op, av):
+            reason = _contains_repeat_or_branch(av[2])
+            if reason:
+                return reason
+            reason = _find_risk(av[2])
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            reason = _find_risk(av[2])
+        elif op is sre_constants.SUBPATTERN:
+            reason = _find_risk(av[-1])
+        elif op is sre_constants.BRANCH:
+            reason = next(filter(None, (_find_risk(branch) for branch in av[1])), None)
+        else:
+            reason = None
+        if reason:
+            return reason
+    return None
@@ -1,47 +1,59 @@
-import sys
-import io
 import re
 import random
 import logging
-from logging.handlers import RotatingFileHandler
 import spacy
-from fuzzywuzzy import fuzz
-from difflib import get_close_matches
 import sqlite3
 from pathlib import Path
+from time import perf_counter
+from request.knowledge_base import (KNOWLEDGE_BASE_PATH, UNRECOGNIZED_RESPONSE, load_knowledge_base,
+                                    knowledge_base_version)
+from request.knowledge_index import KnowledgeIndex
+from request.spelling import SpellingCorrector
+from request.cache import LRUCache
+from request.typo_writer import TypoWriteBehind
+from request.trace import RequestTrace, StageHistograms
+from logging_setup import UNRECOGNIZED_LOGGER
+from config import NLP_ENGINE, NLP_VECTOR_NGRAM_WEIGHT, NLP_TRACE, NLP_TRACE_WINDOW, NLP_TRACE_SLOW_MS
 
-# Устанавливка стандартные потоки ввода-вывода в UTF-8
-sys.stdin = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
-sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
-sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
-
-# Настройка логирования с UTF-8
-def setup_logging():
-    logger = logging.getLogger()
-    logger.setLevel(logging.DEBUG)
-    
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    
-    # Обработчики с явным указанием кодировки UTF-8
-    handlers = [
-        RotatingFileHandler('bot.log', maxBytes=5*1024*1024, backupCount=5, encoding='utf-8'),
-        RotatingFileHandler('unrecognized.log', maxBytes=5*1024*1024, backupCount=5, encoding='utf-8'),
-        logging.StreamHandler(sys.stdout)  # Используем sys.stdout с UTF-8
-    ]
-    
-    handlers[0].setLevel(logging.DEBUG)
-    handlers[1].setLevel(logging.INFO)
-    handlers[2].setLevel(logging.INFO)
-    
-    for handler in handlers:
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
-
-setup_logging()
+unrecognized_logger = logging.getLogger(UNRECOGNIZED_LOGGER)
+
+# Размеры кэшей токен -> лемма и токен -> исправление
+LEMMA_CACHE_SIZE = 20000
+CORRECTION_CACHE_SIZE = 20000
+# Кэш ответов: запрос в нижнем регистре -> категория, время жизни записи в секундах
+# и сколько частых запросов из unrecognized_queries прогреть при старте (0 - не прогревать)
+RESPONSE_CACHE_SIZE = 5000
+RESPONSE_CACHE_TTL = 3600
+RESPONSE_CACHE_WARMUP = 100
+
+# Порог уверенности (ответ, если категория не найдена, - в knowledge_base.py)
+CONFIDENCE_THRESHOLD = 0.7
+# База опечаток и нераспознанных запросов
+TYPO_DB_PATH = "typo_database.db"
+
+# Отметка "в кэше нет записи" (None в кэше ответов означает нераспознанный запрос)
+_MISSING = object()
+
+class MessageAnalysis:
+    #Результат разбора одного сообщения, который читают все оценщики категорий
+    __slots__ = ("text", "normalized", "tokens", "corrected_tokens", "corrected_set")
+
+    def __init__(self, text, normalized, tokens, corrected_tokens):
+        self.text = text
+        self.normalized = normalized
+        self.tokens = tokens
+        self.corrected_tokens = corrected_tokens
+        self.corrected_set = set(corrected_tokens)
 
 class NLPProcessor:
-    def __init__(self):
+    def __init__(self, engine=NLP_ENGINE, db_path=TYPO_DB_PATH, trace=NLP_TRACE):
         logging.info("Initializing NLPProcessor")
+        self.engine = engine
+        self.db_path = Path(db_path)
+        # Трассировка этапов: при выключенной на каждом этапе остаётся одна проверка на None
+        self.tracing = trace
+        self.trace_stats = StageHistograms(NLP_TRACE_WINDOW)
+        self._trace = None
         try:
             # Проверка наличия модели
             if not spacy.util.is_package("ru_core_news_sm"):
@@ -50,10 +62,17 @@ class NLPProcessor:
                 
             self.nlp = spacy.load("ru_core_news_sm")
             logging.info("SpaCy model 'ru_core_news_sm' loaded successfully")
+
+            # Пользователи повторяют одни и те же слова, поэтому леммы и исправления кэшируются
+            self.lemma_cache = LRUCache(LEMMA_CACHE_SIZE)
+            self.correction_cache = LRUCache(CORRECTION_CACHE_SIZE)
+            # Хранится категория, а не текст ответа, чтобы random.choice работал как раньше
+            self.response_cache = LRUCache(RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
             
             self._init_db()
             self._init_typo_dictionary()
             self._init_knowledge_base()
+            self.warm_up_responses(RESPONSE_CACHE_WARMUP)
             
             logging.debug("Knowledge base, typo dictionary, and database initialized")
         except Exception as e:
@@ -63,7 +82,6 @@ class NLPProcessor:
         #Инициализация базы данных для хранения новых слов и ошибок
         logging.debug("Initializing SQLite database")
         try:
-            self.db_path = Path("typo_database.db")
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             cursor.execute('''
@@ -89,39 +107,51 @@ class NLPProcessor:
             typos = cursor.fetchall()
             logging.debug(f"Typos in database: {typos}")
             conn.close()
+            # Запись новых опечаток идёт в фоне пачками, а не на каждое слово
+            self.typo_writer = TypoWriteBehind(self.db_path)
             logging.info("SQLite database initialized")
         except Exception as e:
             logging.error(f"Database initialization error: {e}", exc_info=True)
 
     def _add_typo_to_db(self, correct_word, typo):
-        #Добавление нового ошибочного написания в базу данных
+        #Добавление нового ошибочного написания в базу данных (через отложенную запись)
+        trace = self._trace
+        if trace is not None:
+            started = perf_counter()
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT OR REPLACE INTO typos (correct_word, typo, frequency)
-                VALUES (?, ?, COALESCE((SELECT frequency + 1 FROM typos WHERE correct_word = ? AND typo = ?), 1))
-            ''', (correct_word, typo, correct_word, typo))
-            conn.commit()
-            conn.close()
-            logging.debug(f"Added typo '{typo}' for '{correct_word}' to database")
+            self.typo_writer.add_typo(correct_word, typo)
+            logging.debug("Queued typo '%s' for '%s' for database", typo, correct_word)
+            # Выученная опечатка сразу попадает в индекс исправлений
+            self.typo_dictionary.setdefault(correct_word, []).append(typo)
+            previous = self.correction_cache.peek(typo)
+            if self.spelling.learn(correct_word, typo):
+                self.correction_cache.invalidate(typo)
+                # Ответ зависит только от исправленного слова. Обычно опечатку и раньше исправляли
+                # в это же слово (поиском close/fuzzy), тогда закэшированные ответы остаются верными
+                if previous is None or previous[0] != correct_word:
+                    self.response_cache.clear()
         except Exception as e:
             logging.error(f"Error adding typo to database: {e}", exc_info=True)
+        if trace is not None:
+            trace.add("persistence", perf_counter() - started)
 
     def _add_unrecognized_query_to_db(self, query):
-        #Добавление нераспознанного запроса в базу данных#
+        #Добавление нераспознанного запроса в базу данных (через отложенную запись)
+        trace = self._trace
+        if trace is not None:
+            started = perf_counter()
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT OR REPLACE INTO unrecognized_queries (query, frequency)
-                VALUES (?, COALESCE((SELECT frequency + 1 FROM unrecognized_queries WHERE query = ?), 1))
-            ''', (query, query))
-            conn.commit()
-            conn.close()
-            logging.debug(f"Added unrecognized query '{query}' to database")
+            self.typo_writer.add_unrecognized_query(query)
+            logging.debug("Queued unrecognized query '%s' for database", query)
         except Exception as e:
             logging.error(f"Error adding unrecognized query to database: {e}", exc_info=True)
+        if trace is not None:
+            trace.add("persistence", perf_counter() - started)
+
+    def close(self):
+        #Сбрасывает в базу всё, что ещё не записано
+        if hasattr(self, 'typo_writer'):
+            self.typo_writer.close()
 
     def _init_typo_dictionary(self):
         #Инициализация словаря частых ошибок
@@ -160,493 +190,241 @@ class NLPProcessor:
 
     def _init_knowledge_base(self):
         #Инициализация базы знаний с регулярными выражениями и ключевыми словами
-        #её же можно расширять по базе данных с запросами.
         logging.debug("Initializing knowledge base")
-        self.knowledge_base = [
-            {
-                "patterns": [
-                    r"(привет|здравствуй|добрый|хай|приветствую|здаров|hi|hello|здрасте|приветствую)",
-                    r"(.*)привет(.*)",
-                    r"(.*)здравствуй(.*)",
-                    r"(.*)приветствую(.*)"
-                ],
-                "keywords": ["привет", "здравствуй", "добрый", "прифет"],
-                "responses": [
-                    "Здравствуйте! Чем могу помочь?",
-                    "Привет! Как я могу вам помочь сегодня?",
-                    "Добрый день! Задавайте ваш вопрос."
-                ]
-            },
-            {
-                "patterns": [
-                    r"(.*)график(.*)Александров(.*)",
-                    r"(.*)работает(.*)офис(.*)Александров(.*)",
-                    r"(.*)время(.*)Александров(.*)"
-                ],
-                "keywords": ["график", "александров","работы", "время", "офис", "Александров"],
-                "responses": [
-                    "График работы офиса в г. Александров: пн-пт с 9:00 до 19:00, выходные с 10:00 до 17:00"
-                ]
-            },
-            {
-                "patterns": [
-                    r"(.*)график(.*)офис(.*)Карабаново(.*)",
-                    r"(.*)график(.*)Карабаново(.*)",
-                    r"(.*)время(.*)офис(.*)Карабаново(.*)",
-                    r"(.*)работает(.*)офис(.*)Карабаново(.*)",
-                    r"(.*)время(.*)Карабаново(.*)"
-                ],
-                "keywords": ["график", "Карабаново","работы", "время", "офис"],
-                "responses": [
-                    "График работы офиса в г. Карабаново: вт-пт с 9:00 до 18:00, суб с 10:00 до 17:00, вс-пн выходной"
-                ]
-            },
-            { 
-                "patterns":[
-                    r"(график\sработы\sофиса)"
-                ],
-                "keywords": ["график","работы","офиса","офисов"],
-                "responses":[
-                    "Для уточнения графика работы офиса. напишите какой офис конкретно интересует\n В формате 'График работы офиса Александров'"
-                ]
-
-            },
-            {
-                "patterns": [
-                    r"(.*)график(.*)офис(.*)Струнино(.*)",
-                    r"(.*)график(.*)Струнино(.*)",
-                    r"(.*)время(.*)офис(.*)Струнино(.*)",
-                    r"(.*)графикСтрунино(.*)",
-                    r"(.*)работает(.*)офис(.*)Струнино(.*)",
-                    r"(.*)время(.*)Струнино(.*)"
-                ],
-                "keywords": ["график", "Струнино", "время", "офис"],
-                "responses": [
-                    "График работы офиса в г. Струнино: вт-пт с 9:00 до 18:00, суб с 10:00 до 17:00, вс-пн выходной"
-                ]
-            },
-            {
-                "patterns": [
-                    r"(сколько|когда|как)видеонаблюдение(.*)"
-                ],
-                "keywords": ["видеонаблюдение","сколько","когда","как"],
-                "responses": [
-                    "Вы бы хотели узнать что-то конкретное о услуге видеонаблюдении? \nДля консультации по вопросам видеонаблюдения \nможете связаться с нами по телефону 3-33-00"
-                ]
-            },
-            {
-                "patterns": [
-                    r"(сколько|когда|как)(.*)интернет(.*)"
-                ],
-                "keywords": ["интернет","сколько","когда","как"],
-                "responses": [
-                    "Вы бы хотели узнать что-то конкретное о услуге интернет? \nДля консультации по вопросам интернета \nможете связаться с нами по телефону 3-33-00"
-                ]
-            },
-            {
-                "patterns": [
-                    r"(сколько|когда|как)(.*)телевидение(.*)"
-                ],
-                "keywords": ["телевидение","сколько","когда","как"],
-                "responses": [
-                    "Вы бы хотели узнать что-то конкретное о услуге телевидение? \nДля консультации по вопросам интернета \nможете связаться с нами по телефону 3-33-00"
-                ]
-            },
-               {
-                "patterns": [
-                    r"(IPTV|ip-tv|интернет)(.*) телевидение(.*)"
-                ],
-                "keywords": ["IPTV","ip-tv","интернет телевидение"],
-                "responses": [
-                    "Вы бы хотели узнать что-то конкретное о услуге интернет телевидения? \nДля консультации по вопросам интернета \nможете связаться с нами по телефону 3-33-00"
-                ]
-            },
-               {
-                "patterns": [
-                    r"Телевидение"
-                ],
-                "keywords": ["телевидение"],
-                "responses": [
-                    "Вы бы хотели узнать что-то конкретное о видеонаблюдении? \nДля консультации по вопросам интернета \nможете связаться с нами по телефону 3-33-00"
-                ]
-            },
-               {
-                "patterns": [
-                    r"Телевидение"
-                ],
-                "keywords": ["телевидение"],
-                "responses": [
-                    "Вы бы хотели узнать что-то конкретное о видеонаблюдении? \nДля консультации по вопросам интернета \nможете связаться с нами по телефону 3-33-00"
-                ]
-            },
-            {
-                "patterns": [
-                    r"(.*)стоимость(.*)подключения",
-                    r"(.*)подключение(.*)"
-                ],
-                "keywords": ["стоимость", "подключение"],
-                "responses": [
-                    "Стоимость подключения зависит от адреса. Для консультации звоните по телефону 3-33-00"
-                ]
-            },
-            {
-                "patterns": [
-                    r"(.*)(помоги)(.*)",
-                    r"(.*)(помогите)(.*)",
-                    r"(.*)(техническая\sподдержка|техподдержка|тех\sподдержка|помощь)(.*)",
-                    r"(не\sработает|не\sвключается|сломался|глючит|не\sоткрывает)(.*)",
-                    r"(.*)(проблема|ошибка)(.*)(сайт|ошибка)"
-                ],
-                "keywords": ["техподдержка", "проблема", "ошибка", "не работает", "помогите"],
-                "responses": [
-                    "Пожалуйста опишите проблему более подробно в формате:\n1. Адрес\n2. Характер проблемы\n3. Устройство на котором проблема проявляется"
-                ]
-            },
-            {
-                "patterns": [
-                    r"(.*)(не\sработает|не\sдоступен|не\sгрузит|не\sзагружает|не\sоткрывается)(.*)(сайт|ресурс|страница|портал)(.*)",
-                    r"(.*)(сайт|ресурс)(.*)(не\sгрузится|не\sоткрывается|не\sдоступен)(.*)",
-                    r"(.*)(проблема|ошибка)(.*)(доступ\sк\sсайту|загрузка\sстраницы)",
-                    r"(.*)(не\sмож(ет|гу))(.*)(зайти|перейти|открыть)(.*)(сайт|ресурс)"
-                ],
-                "keywords": ["сайт", "не грузится", "ошибка"],
-                "responses": [
-                    "При проблемах с доступом к сайтам:\n1. Проверьте интернет-соединение\n2. Попробуйте другой браузер\n3. Очистите кэш браузера\n4. Звоните в поддержку по 3-33-00",
-                    "Если сайт не доступен:\n- Проверьте работу других сайтов\n- Попробуйте через мобильный интернет\n- Возможно, ведутся технические работы"
-                ]
-            },
-            {
-                "patterns": [
-                    r"(.*)(контакты|телефон|как\sсвязаться)(.*)",
-                    r"(.*)(позвонить|написать)(.*)",
-                    r"(.*)где\sнаходитесь(.*)"
-                ],
-                "keywords": ["контакты", "телефон", "адрес"],
-                "responses": [
-                    "Контакты:\n📞 Телефон: 8-492-443-33-00\n📍 Адрес: г. Александров, ул. Октябрьская д.8, 1",
-                    "Связаться с нами: телефон 3-33-00 или онлайн-чат на сайте"
-                ]
-            },
-            {
-                "patterns": [
-                    r"(.*)(нет\sинтернетsа|не\sработает)(.*)",
-                    r"(.*)(медленный\sинтернет|тормозит\sинтернет)(.*)",
-                    r"(.*)(пропал\sинтернет)(.*)"
-                ],
-                "keywords": ["интернет",  "медленный","не работает"],
-                "responses": [
-                    "При проблемах с интернетом:\n1. Перезагрузите роутер\n2. Проверьте кабели\n3. Звоните в поддержку по 3-33-00"
-                ]
-            },
-             {
-                "patterns": [
-                    r"(.*)(низкая скорость| слабый интернет)(.*)",
-                    r"(.*) (плохо),(работает интернет)(.*)"
-                ],
-                "keywords": ["плохо работает", "низкая", "скорость", "слабый", "интернет"],
-                "responses": [
-                    "При проблемах со скоростью при подключении:\n1.Убедитесь что вы подключены к Wi-Fi \n2. Замерьте скорость посредством использования https://www.speedtest.net/ \n3. Свяжитесь с нами Техподдержка: 3-33-00"
-                ]
-            },
-            {
-                "patterns": [
-                    r"(не\sработает|не\sвключается|глючит)(.*)(телефон|смартфон|андроид)",
-                    r"(проблема|ошибка)(.*)(телефон|смартфон)"
-                ],
-                "keywords": ["телефон", "смартфон" ],
-                "responses": [
-                    "Попробуйте:\n1. Перезагрузить устройство\n2. Проверить настройки сети\n3. Обновить ПО",
-                    "Для проблем с телефоном проверьте:\n- Заряд батареи\n- Режим полета\n- SIM-карту"
-                ]
-            },
-            {
-                "patterns": [
-                    r"(.*)(не\sгорит|не\sгорят|лампочка|лампочки)(.*)(не\sработает|не\sвключается|сломалась)",
-                    r"(.*)(лампочка|лампочки)(.*)(гаснет|не\sсветит)"
-                ],
-                "keywords": ["лампочка", "не горит"],
-                "responses": [
-                    "Если лампочки не горят:\n1. Проверьте подключение роутера\n2. Убедитесь, что питание включено\n3. Обратитесь в поддержку по 3-33-00"
-                ]
-            },
-            {
-                "patterns": [
-                    r"(.*)(не\sработает|не\sвключается|глючит|не\sпоказывает)(.*)(камера|видеокамера|видеонаблюдение)"
-                ],
-                "keywords": ["видеонаблюдение", "камера", "настройка", "качество", "записи", "поворачивается", "зависает", "не фокусируется", "фокусируется"],
-                "responses": [
-                    "Если видеонаблюдение не работает:\n1. Проверьте подключение камеры\n2. Убедитесь, что приложение обновлено\n3. Перезагрузите устройство\n4. Звоните в поддержку по 3-33-00"
-                ]
-            },
-            {
-                "patterns": [
-                    r"(.*)(не\sзаписывает)(.*)(видео|камера|звук)(.*)"
-                ],
-                "keywords": ["камера", "звук"],
-                "responses": [
-                    "Если камера перестала записывать звук:\n1. Перезагрузите выключив инжектор (её питание) из розетки\n2. Свяжитесь с нами по номеру 3-33-00 для консультации и диагностики"
-                ]
-            },
-            {
-                "patterns": [
-                    r"(.*)(не\sвидно|плохое\sкачество|)(.*)(камере|архиве)(.*)"
-                ],
-                "keywords": ["не видно", "плохое качество", "объектив", " картинка"],
-                "responses": [
-                    "Если камера не фокусируется:\n1. Уточните чиста ли линза самой камеры\n2. Очистите объектив\n3. Звоните в поддержку по 3-33-00"
-                ]
-            },
-            {
-                "patterns": [
-                    r"(.*)(нет\sдоступа)(.*)(архив)(.*)"
-                ],
-                "keywords": ["нет доступа", "архив", "приложение мои камеры"],
-                "responses": [
-                    "Для доступа к записям видеонаблюдения:\n1. Используйте личный кабинет видеонаблюдения\n2. Убедитесь, что подписка активна\n3. Звоните в поддержку по 3-33-00"
-                ]
-            },
-            {
-                "patterns": [
-                    r"(.*)(iptv\sне\sпоказывает\sканалы|черный\sэкран\sна\sтв)(.*)"
-                ],
-                "keywords": ["iptv", "черный экран","IPTV","иптв","телевизор"],
-                "responses": [
-                    "При проблемах с IPTV:\n1. Нажмите 'Источник' на пульте → выберите HDMI\n2. Перезагрузите приставку (отключите на 10 сек)\n3. Проверьте кабель HDMI на повреждения"
-                ]
-            },
-            {
-                "patterns": [
-                    r"(.*)(iptv\sмедленно\sпереключает\sканалы|лагает\sпри\sсмене\sканала)(.*)"
-                ],
-                "keywords": ["медленно", "переключение"],
-                "responses": [
-                    "Решение для медленного переключения:\n1. Проверьте скорость интернета (минимум 15 Мбит/с)\n2. В настройках включите 'Буферизацию'\n3. Обновите плейлист через 'Система → Обновление'"
-                ]
-            },
-            {
-                "patterns": [
-                    r"(.*)(ip\sтелефон\sне\sрегистрируется|ошибка\svoip)(.*)"
-                ],
-                "keywords": ["телефония", "не регистрируется"],
-                "responses": [
-                    "При проблемах с регистрацией:\n1. Проверьте SIP-данные в разделе 'Телефония' ЛК\n2. Убедитесь, что телефон подключен к LAN-порту\n3. Для офисных АТС - проверьте VLAN"
-                ]
-            },
-            {
-                "patterns": [
-                    r"(.*)(пропадает\sзвук\sв\sip\sтелефонии|прерывается\sразговор)(.*)"
-                ],
-                "keywords": ["звук", "прерывается"],
-                "responses": [
-                    "Если пропадает звук:\n1. Проверьте стабильность интернет-соединения\n2. Обновите прошивку телефона\n3. Настройте QoS на роутере для VoIP"
-                ]
-            },
-            {
-                "patterns": [
-                    r"(.*)(жалоба|недоволен|плохой\sсервис)(.*)"
-                ],
-                "keywords": ["жалоба", "плохой сервис", "грубость"],
-                "responses": [
-                    "Сожалеем о неудобствах! Опишите проблему, и мы решим её:\n1. Укажите суть проблемы\n2. Сообщите время инцидента\n3. Звоните в поддержку по 3-33-00"
-                ]
-            },
-            {
-                "patterns": [
-                    r"(.*)(оплата|платеж)(.*)(интернет|видеонаблюдение|телефония|iptv|иптв)(.*)",
-                    r"(.*)(как\sоплатить)(.*)(интернет|видеонаблюдение|телефония|iptv|иптв)(.*)",
-                    r"(.*)(как\sоплатить)(.*)"
-                ],
-                "keywords": ["оплата","услуга", "видеонаблюдение", "телефония", "iptv","оплатить"],
-                "responses": [
-                    "Оплатить услуги видеонаблюдения, IP-телефонии или IPTV можно через личный кабинет, приложение банка или в офисе",
-                    "Способы оплаты: онлайн в личном кабинете, в офисе, через банковское приложение. Для деталей звоните 3-33-00"
-                ]
-            },
-            {
-                "patterns": [
-                    r"(.*)(ip\sтелефон\sне\sзвонит|не\sпроходят\sисходящие\sвызовы)(.*)",
-                    r"(.*)(не\sработает\sисходящая\sсвязь\sна\sip\sтелефонии)(.*)"
-                ],
-                "keywords": ["не звонит", "исходящие вызовы"],
-                "responses": [
-                    "Если не работают исходящие вызовы:\n1. Проверьте баланс SIP-аккаунта в личном кабинете\n2. Убедитесь, что номер не в черном списке\n3. Проверьте настройки исходящего маршрута (Outbound Route)\n4. Техподдержка: 3-33-00"
-                ]
-            },
-            {
-                "patterns": [
-                    r"(.*)(нет\sзвука\sв\sip\sтелефонии|не\sслышно\sсобеседника)(.*)",
-                    r"(.*)(абонент\sне\sслышит\sменя\sпри\sразговоре)(.*)"
-                ],
-                "keywords": ["нет звука", "не слышно"],
-                "responses": [
-                    "При проблемах со звуком:\n1. Проверьте громкость динамика/микрофона на устройстве\n2. Убедитесь, что в настройках кодеков выбран G.711 или G.729\n3. Проверьте NAT-трансляцию на роутере\n4. Техподдержка: 3-33-00"
-                ]
-            },
-            {
-                "patterns": [
-                    r"(.*)(ip\sтелефон\sне\sрегистрируется\sна\sсервере)(.*)",
-                    r"(.*)(ошибка\sрегистрации\svoip\sустройства)(.*)"
-                ],
-                "keywords": ["не регистрируется", "ошибка регистрации"],
-                "responses": [
-                    "При проблемах с регистрацией:\n1. Проверьте логин/пароль SIP (раздел 'Телефония' в ЛК)\n2. Убедитесь, что устройство подключено к интернету\n3. Проверьте настройки прокси-сервера (должен быть ваш VoIP-провайдер)\n4. Техподдержка: 3-33-00"
-                ]
-            },
-            {
-                "patterns": [
-                    r"(.*)(звонки\sпрерываются\sчерез\sN\sсекунд)(.*)",
-                    r"(.*)(разговор\sобрывается\sчерез\sнекоторое\sвремя)(.*)"
-                ],
-                "keywords": ["прерывается", "обрывается"],
-                "responses": [
-                    "Если звонки прерываются:\n1. Проверьте стабильность интернет-соединения (ping < 100ms)\n2. Настройте QoS для VoIP-трафика на роутере\n3. Уменьшите интервал keepalive до 20 сек\n4. Техподдержка: 3-33-00"
-                ]
-            },
-            {
-                "patterns": [
-                    r"(.*)(эхо\sв\sip\sтелефонии|слышу\sсвой\sголос)(.*)"
-                ],
-                "keywords": ["эхо", "свой голос","себя"],
-                "responses": [
-                    "При проблемах с эхом:\n1. Уменьшите громкость динамика на устройстве\n2. Используйте гарнитуру вместо громкой связи\n3. Включите подавление эха в настройках телефона\n4. Техподдержка: 3-33-00"
-                ]
-            },
-            {
-                "patterns": [
-                    r"(.*)(как\sнастроить\sip\sтелефон\sвпервые)(.*)",
-                    r"(.*)(первоначальная\sнастройка\svoip)(.*)"
-                ],
-                "keywords": ["настроить", "первоначальная настройка"],
-                "responses": [
-                    "Первоначальная настройка IP-телефона:\n1. Введите SIP-логин/пароль из личного кабинета\n2. Укажите сервер регистрации: voip.provider.ru\n3. Выберите кодек G.711 или G.729\n4. Для помощи звоните 3-33-00"
-                ]
-            },
-            {
-                "patterns": [
-                    r"(.*)(тарифы)(.*)",
-                    r"(.*)(акции)(.*)"
-                ],
-                "keywords": ["тариф", "стоимость", "акции"],
-                "responses": [
-                    "Актуальную информацию по тарифам и акциям:\n1. Смотрите в личном кабинете в разделе 'Телефония'\n2. Или уточните у оператора по телефону 3-33-00\n3. Текущие акции: бесплатные междугородние звонки по выходным"
-                ]
-            },
-            {
-                "patterns": [
-                    r"(.*)(стоимость|цена|сколько\sстоит)(.*)(видеонаблюдение|телефония|iptv|иптв)",
-                    r"(.*)(подключение|установка)(.*)(видеонаблюдение|телефония|iptv|иптв)"
-                ],
-                "keywords": ["стоимость", "видеонаблюдение", "телефония", "iptv", "подключение"],
-                "responses": [
-                    "Стоимость подключения видеонаблюдения, IP-телефонии или IPTV зависит от тарифа и адреса. Для консультации звоните по телефону 3-33-00",
-                    "Для уточнения цены на установку услуг обратитесь в офис или позвоните по номеру 3-33-00"
-                ]
-            },
-            {
-                "patterns": [
-                    r"(.*)(проконсультируйте)(.*)",
-                    r"(.*)(консультация)(.*)"
-                ],
-                "keywords": [],
-                "responses": [
-                    "Извините, я не понял. Можете переформулировать? Например, спросите про интернет, видеонаблюдение, IP-телефонию или IPTV.",
-                    "Уточните, пожалуйста, ваш вопрос. Я не понял о чем вы."
-                ]
-            },
-            {
-                "patterns": [r".*"],
-                "keywords": [],
-                "responses": [
-                    "Извините, я не понял. Можете переформулировать? Например, спросите про интернет, видеонаблюдение, IP-телефонию или IPTV.",
-                    "Уточните, пожалуйста, ваш вопрос. Я не понял о чем вы."
-                ]
-            }
-        ]
+        self.reload_knowledge_base()
+
+    def reload_knowledge_base(self, path=KNOWLEDGE_BASE_PATH):
+        #Читает базу знаний из файла, строит новый индекс и подменяет им прежний.
+        #Если файл с ошибкой, бросает ValueError и продолжает работать со старой базой.
+        version = knowledge_base_version(path)
+        knowledge_base = load_knowledge_base(path)
+        index = KnowledgeIndex(knowledge_base, self.nlp, engine=self.engine,
+                               ngram_weight=NLP_VECTOR_NGRAM_WEIGHT, version=version)
+        # Индекс исправления опечаток по словарю ошибок и ключевым словам
+        spelling = SpellingCorrector(self.typo_dictionary, index.keyword_index.dictionary)
+        self.index = index
+        self.spelling = spelling
+        # Исправления и ответы, закэшированные по прежней базе знаний, больше не действительны
+        self.correction_cache.clear()
+        self.response_cache.clear()
+        logging.info(f"Knowledge base loaded from {path}: {len(knowledge_base)} categories")
+        return len(knowledge_base)
+
+    def normalize_text(self, text):
+        # Удаляем лишние символы и приводим к нижнему регистру
+        trace = self._trace
+        if trace is None:
+            return re.sub(r'[^\w\s]', '', text.lower())
+        started = perf_counter()
+        normalized = re.sub(r'[^\w\s]', '', text.lower())
+        trace.add("normalize", perf_counter() - started)
+        return normalized
 
     def preprocess_text(self, text):
         # предобработка текста с использованием spaCy
-        logging.debug(f"Preprocessing text: {text}")
+        logging.debug("Preprocessing text: %s", text)
         try:
-            # Удаляем лишние символы и приводим к нижнему регистру
-            text = re.sub(r'[^\w\s]', '', text.lower())
-            doc = self.nlp(text)
-            # Лемматизация и удаление стоп-слов
-            tokens = [token.lemma_ for token in doc if not token.is_stop and len(token.text) > 2]
+            normalized = self.normalize_text(text)
+            trace = self._trace
+            if trace is not None:
+                started = perf_counter()
+            cached = [self.lemma_cache.get(word) for word in normalized.split()]
+            if None in cached:
+                cached = self._cache_lemmas(self.nlp(normalized))
+            tokens = [lemma for lemma, keep in cached if keep]
+            if trace is not None:
+                trace.add("lemmatize", perf_counter() - started)
             return tokens
         except Exception as e:
             logging.error(f"Text preprocessing error: {e}", exc_info=True)
             return []
 
-    def _correct_spelling(self, token, dictionary):
-        #Исправление опечаток с использованием fuzzywuzzy и get_close_matches
+    def _cache_lemmas(self, doc):
+        entries = []
+        for token in doc:
+            if token.is_space:
+                continue
+            # Лемматизация и удаление стоп-слов
+            entry = (token.lemma_, not token.is_stop and len(token.text) > 2)
+            self.lemma_cache.put(token.text, entry)
+            entries.append(entry)
+        return entries
+
+    def _prime_lemmas(self, texts):
+        #Прогоняет через nlp.pipe одним пакетом все сообщения, слов которых ещё нет в кэше лемм
+        pending = []
+        for text in texts:
+            normalized = self.normalize_text(text)
+            if any(word not in self.lemma_cache for word in normalized.split()):
+                pending.append(normalized)
         try:
-            # Проверяем словарь частых ошибок
-            for correct_word, typos in self.typo_dictionary.items():
-                if token in typos:
-                    logging.debug(f"Corrected '{token}' to '{correct_word}' using typo dictionary")
-                    return correct_word
-            # Проверяем схожесть с известными словами
-            matches = get_close_matches(token, dictionary, n=1, cutoff=0.5)
-            if matches:
-                logging.debug(f"Corrected '{token}' to '{matches[0]}' using get_close_matches")
-                self._add_typo_to_db(matches[0], token)
-                return matches[0]
-            # Дополнительная проверка с fuzzywuzzy
-            best_match = None
-            best_score = 0
-            for word in dictionary:
-                score = fuzz.ratio(token, word)
-                if score > 50 and score > best_score:  # Пониженный порог
-                    best_match = word
-                    best_score = score
-            if best_match:
-                logging.debug(f"Corrected '{token}' to '{best_match}' using fuzzywuzzy (score: {best_score})")
-                self._add_typo_to_db(best_match, token)
-                return best_match
-            # Логируем нераспознанное слово
-            logging.info(f"Unrecognized token: '{token}'", extra={'logger_name': 'unrecognized'})
+            for doc in self.nlp.pipe(pending):
+                self._cache_lemmas(doc)
+        except Exception as e:
+            logging.error(f"Batch preprocessing error: {e}", exc_info=True)
+
+    def analyze(self, text):
+        #Однократный разбор сообщения: нормализация, лемматизация и исправление опечаток.
+        #Результат переиспользуется всеми оценщиками категорий и шаблонов.
+        tokens = self.preprocess_text(text)
+        corrected_tokens = [self._correct_spelling(token) for token in tokens]
+        return MessageAnalysis(text, self.normalize_text(text), tokens, corrected_tokens)
+
+    def _correct_spelling(self, token):
+        #Исправление опечаток: словарь частых ошибок, затем get_close_matches и fuzzywuzzy по индексу
+        trace = self._trace
+        if trace is not None:
+            started = perf_counter()
+        try:
+            result = self.correction_cache.get(token)
+            if result is None:
+                result = self.spelling.correct(token)
+                self.correction_cache.put(token, result)
+            if trace is not None:
+                trace.add("correct", perf_counter() - started)
+            correct_word, source = result
+            if source == "typo":
+                logging.debug("Corrected '%s' to '%s' using typo dictionary", token, correct_word)
+                return correct_word
+            if source is not None:
+                logging.debug("Corrected '%s' to '%s' using %s match", token, correct_word, source)
+                if correct_word != token:
+                    self._add_typo_to_db(correct_word, token)
+                return correct_word
+            # Логируем нераспознанное слово (только в unrecognized.log)
+            unrecognized_logger.info("Unrecognized token: '%s'", token)
             return token
         except Exception as e:
             logging.error(f"Spelling correction error for '{token}': {e}", exc_info=True)
             return token
 
-    def _match_pattern_score(self, text, pattern, keywords):
-        #Оценивает, насколько запрос соответствует шаблону (от 0 до 1).
+    def cache_stats(self):
+        return {
+            "lemma": self.lemma_cache.stats(),
+            "correction": self.correction_cache.stats(),
+            "response": self.response_cache.stats(),
+        }
+
+    def trace_report(self):
+        #Скользящая статистика этапов по последним NLP_TRACE_WINDOW трассированным сообщениям
+        return self.trace_stats.get_stats()
+
+    def get_stats(self):
+        #Вся статистика обработчика: шаблоны, кэши и этапы (в режиме "pool" собирается из процессов)
+        return {
+            "intent_matcher": self.index.intent_matcher.get_stats(),
+            "cache": self.cache_stats(),
+            "trace": self.trace_report(),
+        }
+
+    def _keyword_match(self, index, analysis, before):
+        #Лучшая категория по ключевым словам среди категорий с номером меньше before
         try:
-            # Проверка по регулярному выражению
-            if re.fullmatch(pattern, text, re.IGNORECASE):
-                return 1.0  # Полное совпадение
-            # Лемматизация и проверка ключевых слов
-            tokens = self.preprocess_text(text)
-            # Используем общий словарь для исправления опечаток, а не только keywords текущей категории
-            all_keywords = set(kw for cat in self.knowledge_base for kw in cat.get("keywords", []))
-            dictionary = all_keywords if all_keywords else set(keywords)
-            corrected_tokens = [self._correct_spelling(token, dictionary) for token in tokens]
-            # Оценка на основе количества совпавших ключевых слов
-            stemmed_keywords = [self.nlp(keyword)[0].lemma_ for keyword in keywords]
-            matched_keywords = sum(1 for kw in stemmed_keywords if kw in corrected_tokens) # Исправлена опечатка: atched -> matched
-            # Добавлена проверка деления на ноль
-            keyword_count = len(keywords)
-            if keyword_count == 0:
-                 return 0.5 # Или другое значение по умолчанию для категорий без ключевых слов
-            return min(1.0, matched_keywords / keyword_count) # Добавлена закрывающая скобка
+            return index.intent_engine.best_match(analysis.corrected_set, before=before,
+                                                  categories=index.intent_matcher.categories)
         except Exception as e:
-            logging.error(f"Scoring error for pattern '{pattern}': {e}", exc_info=True)
-            return 0.0
+            logging.error(f"Keyword scoring error for '{analysis.text}': {e}", exc_info=True)
+            return None, 0
 
-    def get_response(self, text):
+    def classify(self, text, index=None):
+        #Возвращает (номер лучшей категории или None, оценка от 0 до 1)
+        # Индекс берётся один раз, чтобы перезагрузка базы не подменила его посреди разбора
+        if index is None:
+            index = self.index
+        # Полное совпадение шаблона даёт 1.0, поэтому категории после первой
+        # совпавшей уже не могут её обойти и не оцениваются
+        trace = self._trace
+        if trace is not None:
+            started = perf_counter()
+        first_match = index.intent_matcher.first_match(text)
+        if trace is not None:
+            trace.add("regex", perf_counter() - started)
         best_match = None
         best_score = 0
-        for category in self.knowledge_base:
-            for pattern in category["patterns"]:
-                match_score = self._match_pattern_score(text, pattern, category["keywords"])
-                if match_score > best_score:
-                    best_score = match_score
-                    best_match = category
-        if best_match and best_score > 0.7:  # Порог уверенности
-            return random.choice(best_match["responses"])
+        if first_match != 0:
+            # Сообщение разбирается один раз и только если нужна оценка по ключевым словам
+            analysis = self.analyze(text)
+            if trace is not None:
+                started = perf_counter()
+            best_match, best_score = self._keyword_match(index, analysis, first_match)
+            if trace is not None:
+                trace.add("keyword", perf_counter() - started)
+        if first_match is not None and best_score < 1.0:
+            best_match, best_score = first_match, 1.0
+        return best_match, best_score
+
+    def normalize_query(self, text):
+        #Ключ кэша ответов. Шаблоны проверяются по тексту с пунктуацией и переводами строк
+        #(без учёта регистра), поэтому убирать из ключа можно только регистр.
+        #"цена?" и "цена", "нет\nинтернета" и "нет интернета" - разные записи намеренно:
+        #шаблон может совпасть только с одним из них, и общий ключ отдал бы чужую категорию
+        return text.lower()
+
+    def _cached_category(self, text, index):
+        key = self.normalize_query(text)
+        category_id = self.response_cache.get(key, _MISSING)
+        if category_id is _MISSING:
+            category_id, score = self.classify(text, index)
+            if score <= CONFIDENCE_THRESHOLD:  # Порог уверенности
+                category_id = None
+            self.response_cache.put(key, category_id)
+        return category_id
+
+    def get_response(self, text, trace=None):
+        #Ответ на сообщение. Если передан RequestTrace (или включена трассировка),
+        #в него записывается время этапов, а сам он попадает в скользящую статистику.
+        if trace is None and self.tracing:
+            trace = RequestTrace()
+        if trace is None:
+            return self._get_response(text)
+        self._trace = trace
+        started = perf_counter()
+        try:
+            return self._get_response(text)
+        finally:
+            self._trace = None
+            trace.total = perf_counter() - started
+            self.trace_stats.record(trace)
+            if trace.total * 1000 >= NLP_TRACE_SLOW_MS:
+                logging.info("Slow NLP request (%.0f ms) '%s': %s", trace.total * 1000, text, trace.format())
+
+    def _get_response(self, text):
+        index = self.index
+        category_id = self._cached_category(text, index)
+        if category_id is not None:
+            return random.choice(index.knowledge_base[category_id]["responses"])
         else:
             # Логируем нераспознанный запрос
             self._add_unrecognized_query_to_db(text)
-            return "Извините, я не понял. Уточните вопрос?"
+            return UNRECOGNIZED_RESPONSE
+
+    def warm_up_responses(self, limit):
+        #Заполняет кэш ответов самыми частыми запросами из unrecognized_queries
+        if limit <= 0:
+            return
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute("SELECT query FROM unrecognized_queries ORDER BY frequency DESC LIMIT ?", (limit,))
+            queries = [row[0] for row in cursor.fetchall()]
+            conn.close()
+        except Exception as e:
+            logging.error(f"Response cache warm-up error: {e}", exc_info=True)
+            return
+        self._prime_lemmas(queries)
+        for query in queries:
+            self._cached_category(query, self.index)
+        logging.info(f"Response cache warmed up with {len(queries)} queries")
+
+    def get_responses(self, texts):
+        #Пакетная обработка: леммы всех сообщений считаются одним вызовом nlp.pipe
+        pending = [text for text in texts if self.normalize_query(text) not in self.response_cache]
+        if self.tracing and pending:
+            started = perf_counter()
+            self._prime_lemmas(pending)
+            # Пакетная лемматизация общая для всех сообщений пакета и учитывается отдельно
+            self.trace_stats.record_stage("lemmatize_batch", perf_counter() - started, len(pending))
+        else:
+            self._prime_lemmas(pending)
+        return [self.get_response(text) for text in texts]
 
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+
+
+class NLPBatcher:
+    #Собирает сообщения, пришедшие почти одновременно, в пакеты для nlp.pipe.
+    #Пакет уходит в обработку, когда набрано max_batch_size сообщений или прошло max_wait секунд
+    #с первого сообщения. Каждый вызывающий по-прежнему ждёт только свой ответ.
+
+    def __init__(self, process_batch, max_batch_size, max_wait, max_concurrency=1):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_concurrency = max_concurrency
+        self.queue = None
+        self._semaphore = None
+        self._task = None
+        self._batch_tasks = set()
+        self.stats = {
+            "batches": 0,
+            "messages": 0,
+            "max_batch_size": 0,
+            "queue_delay_total": 0.0,
+            "queue_delay_max": 0.0,
+        }
+
+    def _start(self):
+        self.queue = asyncio.Queue()
+        # Пока все обработчики заняты, новые сообщения копятся и уходят более крупным пакетом
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._task = asyncio.create_task(self._run())
+
+    async def submit(self, text):
+        if self._task is None:
+            self._start()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        await self.queue.put((text, future, loop.time()))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._semaphore.acquire()
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            task = asyncio.create_task(self._process(batch, loop.time()))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _process(self, batch, dispatched_at):
+        self._record(batch, dispatched_at)
+        try:
+            responses = await self.process_batch([text for text, _, _ in batch])
+            for (_, future, _), response in zip(batch, responses):
+                if not future.done():
+                    future.set_result(response)
+        except Exception as e:
+            logging.error(f"NLP batch error: {e}", exc_info=True)
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._semaphore.release()
+
+    def _record(self, batch, dispatched_at):
+        delays = [dispatched_at - queued_at for _, _, queued_at in batch]
+        self.stats["batches"] += 1
+        self.stats["messages"] += len(batch)
+        self.stats["max_batch_size"] = max(self.stats["max_batch_size"], len(batch))
+        self.stats["queue_delay_total"] += sum(delays)
+        self.stats["queue_delay_max"] = max(self.stats["queue_delay_max"], max(delays))
+        logging.debug("NLP batch of %d messages, max queue delay %.1f ms", len(batch), max(delays) * 1000)
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        messages = stats["messages"]
+        stats["avg_batch_size"] = messages / stats["batches"] if stats["batches"] else 0.0
+        stats["avg_queue_delay"] = stats["queue_delay_total"] / messages if messages else 0.0
+        return stats
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
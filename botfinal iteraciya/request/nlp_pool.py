@@ -0,0 +1,136 @@
+import os
+import time
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import util
+
+from logging_setup import setup_utf8_stdio, setup_logging, log_queue, setup_worker_logging
+
+# Как часто (в секундах) рабочий процесс прикладывает свою статистику к ответам
+STATS_INTERVAL = 5.0
+# Сколько секунд get_stats ждёт свежую статистику от свободных процессов
+STATS_REFRESH_TIMEOUT = 1.0
+
+# Экземпляр NLPProcessor внутри рабочего процесса пула
+_worker_processor = None
+# Номер перезагрузки базы знаний, которую процесс уже применил
+_worker_kb_generation = 0
+# Когда процесс последний раз отправил статистику
+_worker_stats_sent = 0.0
+
+
+def _init_worker(queue, kb_generation):
+    #Загружает модель один раз при старте рабочего процесса
+    global _worker_processor, _worker_kb_generation
+    # Файл базы знаний читается ниже, все перезагрузки до этого момента уже учтены
+    _worker_kb_generation = kb_generation
+    if queue is not None:
+        # Записи уходят в основной процесс, файлы логов пишет только он
+        setup_worker_logging(queue)
+    elif not logging.getLogger().handlers:
+        # Процесс, запущенный через spawn, не наследует настройки логирования основного
+        setup_utf8_stdio()
+        setup_logging(mode="direct")
+    # spaCy импортируется только в рабочих процессах, основному процессу он не нужен
+    from request.nlp import NLPProcessor
+    _worker_processor = NLPProcessor()
+    # atexit в дочерних процессах multiprocessing не вызывается, поэтому
+    # отложенные записи сбрасываются через финализатор multiprocessing
+    util.Finalize(None, _worker_processor.close, exitpriority=10)
+
+
+def _worker_get_stats(force=True):
+    #(pid, статистика NLPProcessor) или None, если с прошлой отправки не прошло STATS_INTERVAL
+    global _worker_stats_sent
+    now = time.monotonic()
+    if not force and now - _worker_stats_sent < STATS_INTERVAL:
+        return None
+    _worker_stats_sent = now
+    return os.getpid(), _worker_processor.get_stats()
+
+
+def _worker_ping():
+    return _worker_get_stats()
+
+
+def _sync_knowledge_base(kb_generation):
+    #Перечитывает базу знаний, если после прошлой загрузки была команда перезагрузки.
+    #Модель не перезагружается, подменяется только индекс
+    global _worker_kb_generation
+    if kb_generation == _worker_kb_generation:
+        return
+    _worker_kb_generation = kb_generation
+    try:
+        _worker_processor.reload_knowledge_base()
+    except Exception as e:
+        # Файл проверен основным процессом; если его успели испортить, работаем со старой базой
+        logging.error(f"Knowledge base reload in NLP worker {os.getpid()} failed: {e}", exc_info=True)
+
+
+def _worker_get_responses(texts, kb_generation):
+    _sync_knowledge_base(kb_generation)
+    # Статистика едет вместе с ответами, отдельный запрос к процессу для неё не нужен
+    return _worker_processor.get_responses(texts), _worker_get_stats(force=False)
+
+
+class NLPPool:
+    #Пул процессов с NLPProcessor: тяжёлая обработка не блокирует цикл событий бота
+
+    def __init__(self, pool_size, kb_generation=0):
+        self.pool_size = pool_size
+        # Номер перезагрузки базы знаний: уходит с каждым пакетом, и процесс, у которого он
+        # отстал, перечитывает базу перед обработкой. Остальные процессы при этом не ждут
+        self.kb_generation = kb_generation
+        self.executor = ProcessPoolExecutor(max_workers=pool_size, initializer=_init_worker,
+                                            initargs=(log_queue(), kb_generation))
+        # Последняя полученная статистика каждого процесса: {pid: статистика}
+        self.worker_stats = {}
+        # Запускаем все процессы сразу, чтобы модель загрузилась до первых сообщений
+        self._pings = [self.executor.submit(_worker_ping) for _ in range(pool_size)]
+        for ping in self._pings:
+            ping.add_done_callback(self._store_stats_future)
+        logging.info("NLP process pool started with %d workers", pool_size)
+
+    async def wait_ready(self):
+        #Ждёт, пока хотя бы один процесс загрузит модель и сможет отвечать
+        pings = [asyncio.wrap_future(ping) for ping in self._pings]
+        done, _ = await asyncio.wait(pings, return_when=asyncio.FIRST_COMPLETED)
+        for ping in done:
+            ping.result()
+
+    async def get_responses(self, texts):
+        loop = asyncio.get_running_loop()
+        responses, stats = await loop.run_in_executor(self.executor, _worker_get_responses,
+                                                      texts, self.kb_generation)
+        self._store_stats(stats)
+        return responses
+
+    def _store_stats(self, stats):
+        if stats is not None:
+            pid, processor_stats = stats
+            self.worker_stats[pid] = processor_stats
+
+    def _store_stats_future(self, future):
+        if not future.cancelled() and future.exception() is None:
+            self._store_stats(future.result())
+
+    async def get_stats(self):
+        #Статистика NLPProcessor каждого рабочего процесса: {pid: статистика}.
+        #Процессы присылают её с ответами; дополнительно в пул ставятся обычные задачи, которые
+        #освежают статистику свободных процессов. Занятые процессы их не ждут и никого не блокируют:
+        #по ним отдаётся последняя присланная статистика
+        loop = asyncio.get_running_loop()
+        refresh = [loop.run_in_executor(self.executor, _worker_get_stats) for _ in range(self.pool_size)]
+        done, _ = await asyncio.wait(refresh, timeout=STATS_REFRESH_TIMEOUT)
+        for future in done:
+            if future.exception() is None:
+                self._store_stats(future.result())
+        return dict(self.worker_stats)
+
+    def reload_knowledge_base(self):
+        #Каждый процесс перечитает базу знаний перед своим следующим пакетом
+        self.kb_generation += 1
+
+    def close(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,294 @@
+import time
+import random
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor, BrokenExecutor
+
+from config import (NLP_MODE, NLP_POOL_SIZE, NLP_TIMEOUT, NLP_BATCH_MAX_SIZE, NLP_BATCH_MAX_WAIT,
+                    NLP_NOT_READY_POLICY, NLP_KB_WATCH_INTERVAL, NLP_PRELOAD)
+from request.nlp_batcher import NLPBatcher
+from request.knowledge_base import (KNOWLEDGE_BASE_PATH, UNRECOGNIZED_RESPONSE, load_knowledge_base,
+                                    knowledge_base_version)
+from request.intent_matcher import IntentMatcher
+
+# Ответ, если обработка сообщения не уложилась в отведённое время
+TIMEOUT_RESPONSE = "Извините, я не успел обработать запрос. Попробуйте ещё раз."
+# Через сколько секунд после неудачной загрузки модели пробовать снова (при следующем сообщении)
+LOAD_RETRY_DELAY = 30.0
+
+
+def format_stats(stats):
+    #Краткая сводка collect_stats() для администратора
+    lines = [f"NLP ready: {stats['ready']}"]
+    batcher = stats["batcher"]
+    if batcher is not None:
+        lines.append("batcher: " + ", ".join(f"{name} {value:.2f}" if isinstance(value, float) else f"{name} {value}"
+                                             for name, value in batcher.items()))
+    for name, processor in stats["processors"].items():
+        matcher = processor["intent_matcher"]
+        lines.append(f"[{name}] messages {matcher['messages']}, regex runs/message "
+                     f"{matcher['regex_runs_per_message']:.2f}, regex timeouts {matcher['regex_timeouts']}")
+        caches = ", ".join(f"{cache} {values['hit_rate']:.0%} of {values['hits'] + values['misses']}"
+                           for cache, values in processor["cache"].items())
+        lines.append(f"  cache hit rate: {caches}")
+        for stage, values in processor["trace"].items():
+            lines.append(f"  {stage}: p50 {values['p50_ms']:.1f} ms, p95 {values['p95_ms']:.1f} ms, "
+                         f"max {values['max_ms']:.1f} ms, n={values['count']}")
+    return "\n".join(lines)
+
+
+class NLPService:
+    #Асинхронный вход в NLP для обработчиков aiogram.
+    #В режиме "pool" сообщения обрабатываются в пуле процессов, в режиме "local" -
+    #одним NLPProcessor в отдельном потоке (NLPProcessor не потокобезопасен, поэтому поток один).
+    #Цикл событий не блокируется ни в одном из режимов.
+    #Одновременные сообщения собираются в микропакеты (NLPBatcher) и обрабатываются через nlp.pipe.
+    #Модель грузится в фоне: пока она не готова, текст обрабатывается по политике NLP_NOT_READY_POLICY.
+    #База знаний перезагружается без остановки бота: командой /reload_kb или при изменении файла.
+
+    def __init__(self, mode=NLP_MODE, pool_size=NLP_POOL_SIZE, timeout=NLP_TIMEOUT,
+                 batch_max_size=NLP_BATCH_MAX_SIZE, batch_max_wait=NLP_BATCH_MAX_WAIT,
+                 not_ready_policy=NLP_NOT_READY_POLICY, kb_watch_interval=NLP_KB_WATCH_INTERVAL,
+                 preload=NLP_PRELOAD):
+        self.mode = mode
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.not_ready_policy = not_ready_policy
+        self.kb_watch_interval = kb_watch_interval
+        self.preload = preload
+        self.pool = None
+        self.processor = None
+        self.executor = None
+        self.batcher = None
+        self._ready = None
+        self._loader = None
+        self._load_failed_at = None
+        self._restarter = None
+        # База знаний и шаблоны для ответов до загрузки модели, подменяются вместе
+        self._regex_index = None
+        self._regex_loader = None
+        self._kb_version = None
+        self._reload_lock = None
+        self._watcher = None
+        if batch_max_size > 1:
+            self.batcher = NLPBatcher(self._process_batch, batch_max_size, batch_max_wait,
+                                      max_concurrency=pool_size if mode == "pool" else 1)
+
+    @property
+    def ready(self):
+        #Флаг готовности: модель загружена и сообщения обрабатываются полностью
+        return self._ready is not None and self._ready.is_set()
+
+    def start(self):
+        #Запускает загрузку модели в фоне и сразу возвращает управление (нужен запущенный цикл событий).
+        #Без предзагрузки модель начнёт грузиться при первом свободном тексте.
+        self._ready = asyncio.Event()
+        self._reload_lock = asyncio.Lock()
+        self._kb_version = knowledge_base_version()
+        if self.not_ready_policy == "regex":
+            # Шаблоны для ответов до загрузки модели строятся в потоке, цикл событий не ждёт
+            self._regex_loader = asyncio.create_task(self._build_regex_index())
+        if self.preload:
+            self._start_loading()
+        if self.kb_watch_interval > 0:
+            self._watcher = asyncio.create_task(self._watch_knowledge_base())
+
+    def _start_loading(self):
+        if self._loader is not None and self._loader.done() and not self.ready:
+            # Прошлая загрузка не удалась: пробуем снова, но не чаще раза в LOAD_RETRY_DELAY
+            if time.monotonic() - self._load_failed_at >= LOAD_RETRY_DELAY:
+                self._loader = None
+        if self._loader is None:
+            self._loader = asyncio.create_task(self._load())
+
+    async def _load(self):
+        started = time.perf_counter()
+        try:
+            if self.mode == "pool":
+                from request.nlp_pool import NLPPool
+                self.pool = NLPPool(self.pool_size)
+                await self.pool.wait_ready()
+            else:
+                self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="nlp")
+                loop = asyncio.get_running_loop()
+                self.processor = await loop.run_in_executor(self.executor, self._create_processor)
+        except Exception as e:
+            logging.error(f"NLP model loading failed: {e}", exc_info=True)
+            self._load_failed_at = time.monotonic()
+            await self._close_failed_load()
+            return
+        self._ready.set()
+        logging.info(f"NLP ready in {time.perf_counter() - started:.2f}s ({self.mode} mode)")
+
+    async def _close_failed_load(self):
+        #Освобождает то, что успело запуститься, чтобы следующая попытка начала с нуля
+        loop = asyncio.get_running_loop()
+        pool, self.pool = self.pool, None
+        executor, self.executor = self.executor, None
+        if pool is not None:
+            await loop.run_in_executor(None, pool.close)
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    @staticmethod
+    def _create_processor():
+        from request.nlp import NLPProcessor
+        return NLPProcessor()
+
+    @staticmethod
+    def _create_regex_index():
+        knowledge_base = load_knowledge_base()
+        return knowledge_base, IntentMatcher(knowledge_base)
+
+    async def _build_regex_index(self):
+        try:
+            async with self._reload_lock:
+                if self._regex_index is None:
+                    self._regex_index = await asyncio.to_thread(self._create_regex_index)
+        except Exception as e:
+            logging.error(f"Regex fallback index build failed: {e}", exc_info=True)
+
+    def _regex_response(self, text):
+        #Быстрый ответ только по регулярным выражениям, без spaCy (None, пока шаблоны не готовы)
+        if self._regex_index is None:
+            return None
+        knowledge_base, matcher = self._regex_index
+        category_id = matcher.first_match(text)
+        if category_id is None:
+            return None
+        return random.choice(knowledge_base[category_id]["responses"])
+
+    async def reload_knowledge_base(self):
+        #Перечитывает базу знаний и подменяет индексы, не прерывая обработку сообщений.
+        #Возвращает число категорий; при ошибке в файле бросает ValueError, старая база остаётся.
+        async with self._reload_lock:
+            loop = asyncio.get_running_loop()
+            version = knowledge_base_version()
+            # Файл проверяется до того, как что-либо будет перестроено
+            knowledge_base = await loop.run_in_executor(None, load_knowledge_base)
+            if self.pool is not None:
+                # Процессы пула (в том числе ещё загружающиеся) перечитают базу перед следующим пакетом
+                self.pool.reload_knowledge_base()
+            elif self.ready:
+                await loop.run_in_executor(self.executor, self.processor.reload_knowledge_base)
+            # Если модель ещё грузится, она сама прочитает файл при инициализации
+            self._regex_index = (knowledge_base, IntentMatcher(knowledge_base))
+            self._kb_version = version
+        logging.info(f"Knowledge base reloaded: {len(knowledge_base)} categories")
+        return len(knowledge_base)
+
+    async def _swap_pool(self):
+        #Новый пул загружает базу знаний, пока старый отвечает; затем пулы меняются местами.
+        #Пакеты, уже отправленные в старый пул, дорабатывают в нём.
+        from request.nlp_pool import NLPPool
+        pool = NLPPool(self.pool_size, self.pool.kb_generation)
+        try:
+            await pool.wait_ready()
+        except Exception:
+            await asyncio.get_running_loop().run_in_executor(None, pool.close)
+            raise
+        old_pool, self.pool = self.pool, pool
+        await asyncio.get_running_loop().run_in_executor(None, old_pool.close)
+
+    async def _watch_knowledge_base(self):
+        #Следит за временем изменения файла базы знаний и перезагружает её
+        while True:
+            await asyncio.sleep(self.kb_watch_interval)
+            version = knowledge_base_version()
+            if version is None or version == self._kb_version:
+                continue
+            logging.info(f"Knowledge base file {KNOWLEDGE_BASE_PATH} changed, reloading")
+            try:
+                await self.reload_knowledge_base()
+            except Exception as e:
+                logging.error(f"Knowledge base reload error: {e}", exc_info=True)
+                # Сломанный файл не перечитываем, пока его снова не изменят
+                self._kb_version = version
+
+    async def _process_batch(self, texts):
+        if self.pool is not None:
+            return await self.pool.get_responses(texts)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.processor.get_responses, texts)
+
+    async def get_response(self, text):
+        try:
+            if not self.ready:
+                self._start_loading()
+                response = self._regex_response(text) if self.not_ready_policy == "regex" else None
+                if response is not None:
+                    return response
+                # Сообщение ждёт загрузки модели в пределах общего таймаута
+                await asyncio.wait_for(self._ready.wait(), self.timeout)
+            if self.batcher is not None:
+                return await asyncio.wait_for(self.batcher.submit(text), self.timeout)
+            responses = await asyncio.wait_for(self._process_batch([text]), self.timeout)
+            return responses[0]
+        except asyncio.TimeoutError:
+            logging.warning("NLP timeout (%ss) for text: '%s'", self.timeout, text)
+            return TIMEOUT_RESPONSE
+        except BrokenExecutor as e:
+            # Упал процесс пула: ProcessPoolExecutor больше не принимает задачи
+            logging.error("NLP executor is broken (%r), fallback answer for text: '%s'", e, text)
+            self._restart_pool()
+            return self._fallback_response(text)
+        except Exception as e:
+            logging.error(f"NLP error for text '{text}': {e}", exc_info=True)
+            return self._fallback_response(text)
+
+    def _fallback_response(self, text):
+        #Ответ по шаблонам (если они построены) или "не понял", когда обработка не удалась
+        response = self._regex_response(text)
+        return response if response is not None else UNRECOGNIZED_RESPONSE
+
+    def _restart_pool(self):
+        #Новый пул собирается в фоне через _swap_pool, пока сообщения получают ответ по шаблонам
+        if self.pool is None or (self._restarter is not None and not self._restarter.done()):
+            return
+        self._restarter = asyncio.create_task(self._restart())
+
+    async def _restart(self):
+        try:
+            await self._swap_pool()
+            logging.info("NLP process pool restarted")
+        except Exception as e:
+            logging.error(f"NLP process pool restart failed: {e}", exc_info=True)
+            # Следующая попытка - при первом сообщении после паузы
+            await asyncio.sleep(LOAD_RETRY_DELAY)
+
+    def get_stats(self):
+        return {
+            "ready": self.ready,
+            "batcher": self.batcher.get_stats() if self.batcher is not None else None,
+        }
+
+    async def collect_stats(self):
+        #get_stats() плюс статистика NLPProcessor: в режиме "pool" - каждого рабочего процесса
+        #({pid: статистика}), в режиме "local" - единственного обработчика ({"local": статистика})
+        stats = self.get_stats()
+        stats["processors"] = {}
+        if self.ready:
+            if self.pool is not None:
+                stats["processors"] = await self.pool.get_stats()
+            else:
+                loop = asyncio.get_running_loop()
+                stats["processors"] = {"local": await loop.run_in_executor(self.executor, self.processor.get_stats)}
+        return stats
+
+    def close(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+        if self._regex_loader is not None:
+            self._regex_loader.cancel()
+        if self._restarter is not None:
+            self._restarter.cancel()
+        if self._loader is not None:
+            self._loader.cancel()
+        if self.batcher is not None:
+            self.batcher.close()
+        if self.pool is not None:
+            self.pool.close()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+        if self.processor is not None:
+            self.processor.close()
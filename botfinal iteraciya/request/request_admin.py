@@ -1,9 +1,8 @@
-import sqlite3
+from database import get_connection
 
 def get_all_routers():
     """Получение всех роутеров из базы данных"""
-    conn = sqlite3.connect('user_data.db')
-    cursor = conn.cursor()
+    cursor = get_connection().cursor()
     
     try:
         cursor.execute('SELECT * FROM routers_table')
@@ -17,8 +16,6 @@ def get_all_routers():
     except Exception as e:
         print(f"Ошибка при получении данных: {e}")
         return []
-    finally:
-        conn.close()
 
 #Функция для красивого отображения
 def format_router_for_display(router):
@@ -37,8 +34,7 @@ def format_router_for_display(router):
 def get_all_tariffs():
     
     """Получение всех тарифов"""
-    conn = sqlite3.connect('user_data.db')
-    cursor = conn.cursor()
+    cursor = get_connection().cursor()
     
     try:
         cursor.execute('SELECT * FROM tariffs_table')
@@ -52,8 +48,6 @@ def get_all_tariffs():
     except Exception as e:
         print(f"Ошибка при получении данных: {e}")
         return []
-    finally:
-        conn.close()
 
 #Функция для красивого отображения     
 def format_tarifs_for_display(tarif):
@@ -0,0 +1,87 @@
+import math
+from difflib import SequenceMatcher
+from fuzzywuzzy import fuzz
+
+
+# Минимальная схожесть (как cutoff у get_close_matches и порог 50 у fuzz.ratio)
+DEFAULT_CUTOFF = 0.5
+
+
+class SpellingCorrector:
+    #Индекс для исправления опечаток.
+    #Словарь частых ошибок развёрнут в обратную карту опечатка -> слово (поиск за O(1)),
+    #а слова словаря разложены по длине: схожесть 2*M/(a+b) не может достичь cutoff,
+    #если длины слов слишком разные, поэтому такие корзины даже не просматриваются.
+
+    def __init__(self, typo_dictionary, dictionary, cutoff=DEFAULT_CUTOFF):
+        self.cutoff = cutoff
+        self.typo_map = {}
+        for correct_word, typos in typo_dictionary.items():
+            for typo in typos:
+                # При повторах побеждает первое слово, как при линейном обходе словаря
+                self.typo_map.setdefault(typo, correct_word)
+        self.set_dictionary(dictionary)
+
+    def set_dictionary(self, dictionary):
+        # Корзины собираются заранее и подменяются вместе со словарём
+        buckets = {}
+        for word in sorted(set(dictionary)):
+            buckets.setdefault(len(word), []).append(word)
+        self.dictionary, self.buckets = set(dictionary), buckets
+
+    def learn(self, correct_word, typo):
+        #Новая опечатка сразу доступна для поиска, без перезагрузки словаря.
+        #Возвращает False, если опечатка уже была в словаре и ничего не изменилось
+        if typo in self.typo_map:
+            return False
+        self.typo_map[typo] = correct_word
+        return True
+
+    def _candidates(self, token):
+        # 2*min(a, b)/(a + b) >= cutoff  <=>  b лежит в [a*c/(2-c), a*(2-c)/c]
+        length = len(token)
+        if length == 0:
+            return
+        low = math.ceil(length * self.cutoff / (2 - self.cutoff) - 1e-9)
+        high = math.floor(length * (2 - self.cutoff) / self.cutoff + 1e-9)
+        for word_length in range(max(low, 0), high + 1):
+            yield from self.buckets.get(word_length, ())
+
+    def close_match(self, token):
+        #То же, что get_close_matches(token, dictionary, n=1, cutoff), но только по подходящим корзинам
+        if token in self.dictionary:
+            return token
+        matcher = SequenceMatcher()
+        matcher.set_seq2(token)
+        best = None
+        for word in self._candidates(token):
+            matcher.set_seq1(word)
+            if matcher.real_quick_ratio() >= self.cutoff and matcher.quick_ratio() >= self.cutoff:
+                candidate = (matcher.ratio(), word)
+                if candidate[0] >= self.cutoff and (best is None or candidate > best):
+                    best = candidate
+        return best[1] if best else None
+
+    def fuzzy_match(self, token):
+        #Дополнительная проверка fuzz.ratio (отличается от difflib, если установлен python-Levenshtein)
+        best_match = None
+        best_score = 0
+        for word in self._candidates(token):
+            score = fuzz.ratio(token, word)
+            if score > self.cutoff * 100 and score > best_score:
+                best_match = word
+                best_score = score
+        return best_match, best_score
+
+    def correct(self, token):
+        #Возвращает (исправленное слово, источник) или (token, None), если исправить нечем
+        correct_word = self.typo_map.get(token)
+        if correct_word is not None:
+            return correct_word, "typo"
+        match = self.close_match(token)
+        if match is not None:
+            return match, "close"
+        match, score = self.fuzzy_match(token)
+        if match is not None:
+            return match, "fuzzy"
+        return token, None
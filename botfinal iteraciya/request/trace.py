@@ -0,0 +1,89 @@
+from collections import deque
+
+
+# Этапы обработки сообщения в порядке прохождения
+STAGES = ("normalize", "lemmatize", "correct", "regex", "keyword", "persistence")
+# Границы корзин гистограммы задержек, мс
+BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+
+
+class RequestTrace:
+    #Время и число вызовов каждого этапа при обработке одного сообщения.
+    #Время этапов не пересекается: запись опечатки в базу идёт в persistence, а не в correct.
+    __slots__ = ("stages", "total")
+
+    def __init__(self):
+        self.stages = {}
+        self.total = 0.0
+
+    def add(self, stage, seconds, calls=1):
+        entry = self.stages.get(stage)
+        if entry is None:
+            self.stages[stage] = [seconds, calls]
+        else:
+            entry[0] += seconds
+            entry[1] += calls
+
+    def as_dict(self):
+        return {
+            "total_ms": self.total * 1000,
+            "stages": {stage: {"ms": seconds * 1000, "calls": calls}
+                       for stage, (seconds, calls) in self.stages.items()},
+        }
+
+    def format(self):
+        parts = [f"{stage} {self.stages[stage][0] * 1000:.1f} ms x{self.stages[stage][1]}"
+                 for stage in STAGES if stage in self.stages]
+        return ", ".join(parts)
+
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))]
+
+
+class StageHistograms:
+    #Скользящая статистика по последним window сообщениям: перцентили и гистограмма по этапам
+
+    def __init__(self, window):
+        self.window = window
+        self.samples = {}
+
+    def record(self, trace):
+        for stage, (seconds, calls) in trace.stages.items():
+            self.record_stage(stage, seconds, calls)
+        self.record_stage("total", trace.total, 1)
+
+    def record_stage(self, stage, seconds, calls=1):
+        samples = self.samples.get(stage)
+        if samples is None:
+            samples = self.samples[stage] = deque(maxlen=self.window)
+        samples.append((seconds, calls))
+
+    def get_stats(self):
+        stats = {}
+        # Этапы выводятся в порядке обработки, прочие (total, пакетные) - после них
+        order = {stage: position for position, stage in enumerate(STAGES)}
+        for stage in sorted(self.samples, key=lambda stage: order.get(stage, len(STAGES))):
+            samples = self.samples[stage]
+            durations = sorted(seconds * 1000 for seconds, _ in samples)
+            histogram = {f"<={bound}ms": 0 for bound in BUCKETS_MS}
+            histogram[f">{BUCKETS_MS[-1]}ms"] = 0
+            for ms in durations:
+                for bound in BUCKETS_MS:
+                    if ms <= bound:
+                        histogram[f"<={bound}ms"] += 1
+                        break
+                else:
+                    histogram[f">{BUCKETS_MS[-1]}ms"] += 1
+            stats[stage] = {
+                "count": len(durations),
+                "calls_per_request": sum(calls for _, calls in samples) / len(samples),
+                "p50_ms": _percentile(durations, 0.50),
+                "p95_ms": _percentile(durations, 0.95),
+                "max_ms": durations[-1],
+                "histogram": histogram,
+            }
+        return stats
+
+    def reset(self):
+        self.samples.clear()
@@ -0,0 +1,99 @@
+import atexit
+import sqlite3
+import logging
+import threading
+
+
+# Как часто сбрасывать накопленное в базу и при каком объёме сбрасывать досрочно
+FLUSH_INTERVAL = 5.0
+FLUSH_THRESHOLD = 200
+
+
+class TypoWriteBehind:
+    #Отложенная запись опечаток и нераспознанных запросов в typo_database.db.
+    #Приращения частот копятся в памяти и пишутся фоновым потоком одной транзакцией,
+    #поэтому на пути ответа пользователю обращений к диску нет.
+
+    def __init__(self, db_path, flush_interval=FLUSH_INTERVAL, flush_threshold=FLUSH_THRESHOLD):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.pending_typos = {}
+        self.pending_queries = {}
+        self.stats = {"flushes": 0, "rows_written": 0, "errors": 0}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="typo-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def add_typo(self, correct_word, typo):
+        with self._lock:
+            key = (correct_word, typo)
+            self.pending_typos[key] = self.pending_typos.get(key, 0) + 1
+            full = self._pending_count() >= self.flush_threshold
+        if full:
+            self._wakeup.set()
+
+    def add_unrecognized_query(self, query):
+        with self._lock:
+            self.pending_queries[query] = self.pending_queries.get(query, 0) + 1
+            full = self._pending_count() >= self.flush_threshold
+        if full:
+            self._wakeup.set()
+
+    def _pending_count(self):
+        return len(self.pending_typos) + len(self.pending_queries)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        #Сбрасывает накопленные приращения одной транзакцией
+        with self._lock:
+            typos, self.pending_typos = self.pending_typos, {}
+            queries, self.pending_queries = self.pending_queries, {}
+        if not typos and not queries:
+            return 0
+        try:
+            conn = sqlite3.connect(self.db_path)
+            try:
+                with conn:
+                    conn.executemany('''
+                        INSERT INTO typos (correct_word, typo, frequency) VALUES (?, ?, ?)
+                        ON CONFLICT(correct_word, typo) DO UPDATE SET frequency = frequency + excluded.frequency
+                    ''', [(correct_word, typo, count) for (correct_word, typo), count in typos.items()])
+                    conn.executemany('''
+                        INSERT INTO unrecognized_queries (query, frequency) VALUES (?, ?)
+                        ON CONFLICT(query) DO UPDATE SET frequency = frequency + excluded.frequency
+                    ''', list(queries.items()))
+            finally:
+                conn.close()
+        except Exception as e:
+            logging.error(f"Error flushing typos to database: {e}", exc_info=True)
+            self.stats["errors"] += 1
+            # Возвращаем несохранённое обратно, чтобы не потерять частоты
+            with self._lock:
+                for key, count in typos.items():
+                    self.pending_typos[key] = self.pending_typos.get(key, 0) + count
+                for key, count in queries.items():
+                    self.pending_queries[key] = self.pending_queries.get(key, 0) + count
+            return 0
+        rows = len(typos) + len(queries)
+        self.stats["flushes"] += 1
+        self.stats["rows_written"] += rows
+        logging.debug("Flushed %d typos and %d unrecognized queries to database", len(typos), len(queries))
+        return rows
+
+    def close(self):
+        #Останавливает фоновый поток и дописывает всё, что осталось в памяти
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join()
+        self.flush()
@@ -0,0 +1,120 @@
+import logging
+import numpy as np
+
+
+# Длина символьных n-грамм для нечёткой части оценки
+NGRAM_SIZE = 3
+
+
+def char_ngrams(word, size=NGRAM_SIZE):
+    padded = f" {word} "
+    if len(padded) <= size:
+        return [padded]
+    return [padded[i:i + size] for i in range(len(padded) - size + 1)]
+
+
+class VectorIntentEngine:
+    #Векторная оценка категорий: ключевые слова всех категорий собраны в разреженную
+    #матрицу признаков (CSR в массивах numpy), и сообщение оценивается по всем категориям
+    #одним умножением матрицы на вектор.
+    #Лемматическая часть даёт ту же оценку, что и KeywordIndex (совпавшие / все ключевые слова).
+    #При ngram_weight > 0 к ней подмешивается косинусная близость по символьным n-граммам.
+
+    def __init__(self, knowledge_base, lemmas, ngram_weight=0.0):
+        self.ngram_weight = ngram_weight
+        self._mask_source = None
+        self._mask = None
+        self.category_count = len(knowledge_base)
+        self.vocabulary = {}
+        rows, cols, counts = [], [], []
+        keyword_counts = []
+        for category_id, category in enumerate(knowledge_base):
+            keywords = category.get("keywords", [])
+            keyword_counts.append(len(keywords))
+            features = {}
+            for keyword in keywords:
+                column = self.vocabulary.setdefault(lemmas[keyword], len(self.vocabulary))
+                features[column] = features.get(column, 0) + 1
+            for column, count in features.items():
+                rows.append(category_id)
+                cols.append(column)
+                counts.append(count)
+        self.rows = np.array(rows, dtype=np.int64)
+        self.cols = np.array(cols, dtype=np.int64)
+        self.counts = np.array(counts, dtype=np.float64)
+        self.keyword_counts = np.array(keyword_counts, dtype=np.float64)
+        # Категории без ключевых слов по ключевым словам не оцениваются
+        self.has_keywords = self.keyword_counts > 0
+        self.safe_counts = np.where(self.has_keywords, self.keyword_counts, 1.0)
+
+        if ngram_weight > 0:
+            self._build_ngrams(knowledge_base, lemmas)
+        logging.debug(f"Vector intent engine built: {self.category_count} categories, "
+                      f"{len(self.vocabulary)} lemma features")
+
+    def _build_ngrams(self, knowledge_base, lemmas):
+        self.ngram_vocabulary = {}
+        rows, cols, weights = [], [], []
+        for category_id, category in enumerate(knowledge_base):
+            features = {}
+            for keyword in category.get("keywords", []):
+                for ngram in char_ngrams(lemmas[keyword]):
+                    column = self.ngram_vocabulary.setdefault(ngram, len(self.ngram_vocabulary))
+                    features[column] = features.get(column, 0) + 1
+            norm = np.sqrt(sum(value * value for value in features.values())) or 1.0
+            for column, value in features.items():
+                rows.append(category_id)
+                cols.append(column)
+                weights.append(value / norm)
+        self.ngram_rows = np.array(rows, dtype=np.int64)
+        self.ngram_cols = np.array(cols, dtype=np.int64)
+        self.ngram_weights = np.array(weights, dtype=np.float64)
+
+    def _matvec(self, rows, cols, weights, vector):
+        # Разреженное произведение матрицы на вектор за один проход numpy
+        return np.bincount(rows, weights=weights * vector[cols], minlength=self.category_count)
+
+    def _ngram_scores(self, tokens):
+        vector = np.zeros(len(self.ngram_vocabulary), dtype=np.float64)
+        for token in tokens:
+            for ngram in char_ngrams(token):
+                column = self.ngram_vocabulary.get(ngram)
+                if column is not None:
+                    vector[column] += 1.0
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return np.zeros(self.category_count, dtype=np.float64)
+        return self._matvec(self.ngram_rows, self.ngram_cols, self.ngram_weights, vector / norm)
+
+    def score_all(self, tokens):
+        #Оценки всех категорий (от 0 до 1) одним вектором
+        vector = np.zeros(len(self.vocabulary), dtype=np.float64)
+        for token in set(tokens):
+            column = self.vocabulary.get(token)
+            if column is not None:
+                vector[column] = 1.0
+        matched = self._matvec(self.rows, self.cols, self.counts, vector)
+        scores = np.where(self.has_keywords, np.minimum(1.0, matched / self.safe_counts), 0.0)
+        if self.ngram_weight > 0:
+            scores = (1 - self.ngram_weight) * scores + self.ngram_weight * self._ngram_scores(tokens)
+        return scores
+
+    def _category_mask(self, categories):
+        # Маска допустимых категорий строится один раз для одного и того же набора
+        if self._mask_source is not categories:
+            mask = np.zeros(self.category_count, dtype=bool)
+            mask[list(categories)] = True
+            self._mask_source, self._mask = categories, mask
+        return self._mask
+
+    def best_match(self, tokens, before=None, categories=None):
+        #Лучшая категория (номер, оценка); при равенстве побеждает категория с меньшим номером
+        scores = self.score_all(tokens)
+        if categories is not None:
+            scores = np.where(self._category_mask(categories), scores, 0.0)
+        if before is not None:
+            scores[before:] = 0.0
+        best = int(np.argmax(scores)) if self.category_count else 0
+        if not self.category_count or scores[best] <= 0:
+            return None, 0
+        return best, float(scores[best])
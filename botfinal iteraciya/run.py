@@ -1,5 +1,4 @@
 import asyncio
-import logging
 
 #import sqlite3
 
@@ -7,19 +6,37 @@ from aiogram import Bot, Dispatcher
 
 from bot import TOKEN 
 from utils import initialize_database, check_tables
-from handlers.handlers import  router
+from database import database
+from repositories import repositories
+from middlewares import DatabaseMiddleware, AuthMiddleware
+from handlers.handlers import  router, nlp_service
+from logging_setup import setup_utf8_stdio, setup_logging
 
 
 async def main():
     initialize_database()
     check_tables()
+    # Модель NLP грузится в фоне (или при первом сообщении), опрос Telegram начинается сразу
+    nlp_service.start()
     bot = Bot(token=TOKEN)
     dp = Dispatcher()
+    # Каждое обновление получает асинхронный доступ к базе (запросы идут в пуле потоков)
+    dp.update.outer_middleware(DatabaseMiddleware(repositories))
+    # Роль пользователя (админ/пользователь) определяется один раз на обновление
+    dp.update.outer_middleware(AuthMiddleware(repositories))
     dp.include_routers(router)
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        # Останавливаем NLP и дописываем накопленные опечатки перед выходом
+        nlp_service.close()
+        await repositories.close()
+        database.close()
 
 if __name__ == '__main__':
-    logging.basicConfig(level=logging.INFO) 
+    # Потоки и логирование настраиваются здесь, а не при импорте модулей
+    setup_utf8_stdio()
+    setup_logging()
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
@@ -0,0 +1,245 @@
+#Замер задержки и пропускной способности NLPProcessor.get_response на реальных запросах.
+#Корпус берётся из строк "Processing user request" в bot.log и из таблицы unrecognized_queries.
+#Бот и Telegram не нужны; база опечаток подменяется временной копией, настоящая не меняется.
+#Запуск из папки бота:
+#  python -m tools.bench_nlp                         - замер и отчёт
+#  python -m tools.bench_nlp --save-baseline         - сохранить результат как базовый
+#  python -m tools.bench_nlp --check --threshold 0.2 - код выхода 1, если задержка выросла больше чем на 20%
+#  python -m tools.bench_nlp --trace                 - плюс разбивка времени по этапам обработки
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import sqlite3
+import logging
+import argparse
+import tempfile
+
+from request.nlp import NLPProcessor, TYPO_DB_PATH
+from tools.log_lines import decode_line
+
+REQUEST_RE = re.compile(r"Processing user request: (.*)")
+DEFAULT_BASELINE = os.path.join("tools", "bench_nlp_baseline.json")
+# Метрики задержки, которые сравниваются с базовыми
+CHECKED_METRICS = ("p50_ms", "p95_ms", "p99_ms")
+
+
+def queries_from_log(path):
+    queries = []
+    try:
+        with open(path, 'rb') as f:
+            for raw in f:
+                match = REQUEST_RE.search(decode_line(raw).rstrip('\r\n'))
+                if match and match.group(1).strip():
+                    queries.append(match.group(1))
+    except OSError as e:
+        print(f"Не удалось прочитать {path}: {e}")
+    return queries
+
+
+def queries_from_db(path):
+    try:
+        conn = sqlite3.connect(path)
+        cursor = conn.cursor()
+        cursor.execute("SELECT query FROM unrecognized_queries ORDER BY frequency DESC")
+        queries = [query for (query,) in cursor.fetchall()]
+        conn.close()
+        return queries
+    except sqlite3.Error as e:
+        print(f"Не удалось прочитать {path}: {e}")
+        return []
+
+
+def stub_typo_db(source, directory):
+    #Временная копия базы опечаток (или пустая, если исходной нет)
+    path = os.path.join(directory, "typo_database.db")
+    if source and os.path.exists(source):
+        shutil.copyfile(source, path)
+    return path
+
+
+class CountingNLP:
+    #Обёртка над моделью spaCy, считающая документы, прошедшие через модель
+    def __init__(self, nlp):
+        self.nlp = nlp
+        self.calls = 0
+
+    def __call__(self, text, *args, **kwargs):
+        self.calls += 1
+        return self.nlp(text, *args, **kwargs)
+
+    def pipe(self, texts, *args, **kwargs):
+        for doc in self.nlp.pipe(texts, *args, **kwargs):
+            self.calls += 1
+            yield doc
+
+    def __getattr__(self, name):
+        return getattr(self.nlp, name)
+
+
+class CountingWriter:
+    #Обёртка над отложенной записью, считающая записи в SQLite, которые запросил обработчик
+    def __init__(self, writer):
+        self.writer = writer
+        self.writes = 0
+
+    def add_typo(self, correct_word, typo):
+        self.writes += 1
+        self.writer.add_typo(correct_word, typo)
+
+    def add_unrecognized_query(self, query):
+        self.writes += 1
+        self.writer.add_unrecognized_query(query)
+
+    def __getattr__(self, name):
+        return getattr(self.writer, name)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_pass(processor, corpus):
+    #Прогоняет корпус через get_response, возвращает задержки в секундах и общее время
+    latencies = []
+    started = time.perf_counter()
+    for text in corpus:
+        begin = time.perf_counter()
+        processor.get_response(text)
+        latencies.append(time.perf_counter() - begin)
+    return latencies, time.perf_counter() - started
+
+
+def summarize(latencies, elapsed, spacy_calls, db_writes):
+    latencies = sorted(latencies)
+    messages = len(latencies)
+    return {
+        "messages": messages,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": latencies[-1] * 1000 if latencies else 0.0,
+        "messages_per_second": messages / elapsed if elapsed else 0.0,
+        "spacy_calls_per_message": spacy_calls / messages if messages else 0.0,
+        "sqlite_writes_per_message": db_writes / messages if messages else 0.0,
+    }
+
+
+def benchmark(corpus, db_source, repeat, trace=False):
+    #Первый проход по корпусу - с пустыми кэшами ("cold"), остальные - с заполненными ("warm")
+    phases = {}
+    with tempfile.TemporaryDirectory() as directory:
+        processor = NLPProcessor(db_path=stub_typo_db(db_source, directory), trace=trace)
+        try:
+            nlp = processor.nlp = CountingNLP(processor.nlp)
+            writer = processor.typo_writer = CountingWriter(processor.typo_writer)
+            processor.lemma_cache.clear()
+            processor.correction_cache.clear()
+            processor.response_cache.clear()
+            for run in range(repeat):
+                # Ответы выбираются случайно, фиксируем выбор для повторяемости
+                random.seed(0)
+                nlp.calls = writer.writes = 0
+                latencies, elapsed = run_pass(processor, corpus)
+                phase = phases.setdefault("cold" if run == 0 else "warm", [[], 0.0, 0, 0])
+                phase[0].extend(latencies)
+                phase[1] += elapsed
+                phase[2] += nlp.calls
+                phase[3] += writer.writes
+            writer.flush()
+            rows_flushed = writer.stats["rows_written"]
+            stages = processor.trace_report() if trace else None
+        finally:
+            processor.close()
+    results = {name: summarize(*phase) for name, phase in phases.items()}
+    results["sqlite_rows_flushed"] = rows_flushed
+    if stages is not None:
+        results["stages"] = stages
+    return results
+
+
+def print_report(results):
+    for name in ("cold", "warm"):
+        if name not in results:
+            continue
+        r = results[name]
+        print(f"{name}: {r['messages']} сообщений, "
+              f"p50 {r['p50_ms']:.2f} ms, p95 {r['p95_ms']:.2f} ms, p99 {r['p99_ms']:.2f} ms, "
+              f"max {r['max_ms']:.2f} ms, {r['messages_per_second']:.1f} сообщ/с, "
+              f"spaCy {r['spacy_calls_per_message']:.2f}/сообщ, SQLite {r['sqlite_writes_per_message']:.2f}/сообщ")
+    print(f"Строк записано в SQLite после сброса: {results.get('sqlite_rows_flushed', 0)}")
+    for stage, s in results.get("stages", {}).items():
+        print(f"  {stage}: {s['count']} сообщений, {s['calls_per_request']:.2f} вызовов/сообщ, "
+              f"p50 {s['p50_ms']:.3f} ms, p95 {s['p95_ms']:.3f} ms, max {s['max_ms']:.3f} ms")
+
+
+def check_regressions(results, baseline, threshold):
+    #Список метрик, задержка по которым выросла больше чем на threshold относительно базовой
+    regressions = []
+    for name in ("cold", "warm"):
+        for metric in CHECKED_METRICS:
+            current = results.get(name, {}).get(metric)
+            expected = baseline.get(name, {}).get(metric)
+            if current is None or not expected:
+                continue
+            if current > expected * (1 + threshold):
+                regressions.append(f"{name}.{metric}: {expected:.2f} -> {current:.2f} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк NLPProcessor.get_response")
+    parser.add_argument("--log", default="bot.log", help="лог бота со строками 'Processing user request'")
+    parser.add_argument("--db", default=TYPO_DB_PATH, help="база опечаток, с копией которой идёт замер")
+    parser.add_argument("--repeat", type=int, default=3, help="сколько раз прогнать корпус")
+    parser.add_argument("--limit", type=int, default=0, help="взять не больше N запросов (0 - все)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="файл с базовыми результатами")
+    parser.add_argument("--save-baseline", action="store_true", help="сохранить результат как базовый")
+    parser.add_argument("--check", action="store_true", help="сравнить с базовыми результатами")
+    parser.add_argument("--threshold", type=float, default=0.2, help="допустимый рост задержки (0.2 = 20%%)")
+    parser.add_argument("--trace", action="store_true", help="собрать время по этапам обработки")
+    args = parser.parse_args()
+
+    # Логи обработчика не должны влиять на замер
+    logging.getLogger().setLevel(logging.WARNING)
+
+    corpus = queries_from_log(args.log) + queries_from_db(args.db)
+    if args.limit > 0:
+        corpus = corpus[:args.limit]
+    if not corpus:
+        print("Корпус запросов пуст")
+        return 1
+
+    results = benchmark(corpus, args.db, max(1, args.repeat), trace=args.trace)
+    print_report(results)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Базовые результаты сохранены в {args.baseline}")
+
+    if args.check:
+        try:
+            with open(args.baseline, encoding='utf-8') as f:
+                baseline = json.load(f)
+        except OSError as e:
+            print(f"Не удалось прочитать {args.baseline}: {e}")
+            return 1
+        regressions = check_regressions(results, baseline, args.threshold)
+        if regressions:
+            print(f"Задержка выросла больше чем на {args.threshold:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("Регрессий задержки нет")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
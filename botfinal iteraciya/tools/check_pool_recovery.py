@@ -0,0 +1,68 @@
+#Проверка восстановления NLP после падения процесса пула: процесс убивается, следующее сообщение
+#должно получить ответ (по шаблонам или "не понял"), а пул - пересобраться и снова отвечать сам.
+#Бот и Telegram не нужны. Запуск из папки бота:  python -m tools.check_pool_recovery
+#Код выхода 1, если сообщение осталось без ответа или пул не восстановился.
+import os
+import sys
+import signal
+import asyncio
+import logging
+
+from logging_setup import setup_logging
+from request.nlp_service import NLPService
+
+# Сколько секунд ждать загрузки модели и пересборки пула
+WAIT_TIMEOUT = 120.0
+
+
+async def wait_for(condition, timeout=WAIT_TIMEOUT):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        if loop.time() > deadline:
+            return False
+        await asyncio.sleep(0.1)
+    return True
+
+
+async def check():
+    service = NLPService(mode="pool", pool_size=2, kb_watch_interval=0)
+    service.start()
+    try:
+        if not await wait_for(lambda: service.ready):
+            print("Модель не загрузилась")
+            return 1
+        print(f"Ответ до падения: {await service.get_response('привет')!r}")
+
+        broken_pool = service.pool
+        pid = next(iter(broken_pool.worker_stats))
+        os.kill(pid, getattr(signal, "SIGKILL", signal.SIGTERM))
+        print(f"Процесс пула {pid} убит")
+
+        response = await service.get_response("привет")
+        print(f"Ответ после падения: {response!r}")
+        if not response:
+            print("Сообщение осталось без ответа")
+            return 1
+
+        if not await wait_for(lambda: service.pool is not broken_pool):
+            print("Пул не пересобран")
+            return 1
+        response = await service.get_response("нет интернета")
+        print(f"Ответ нового пула: {response!r}")
+        if not response:
+            return 1
+        print("Пул восстановлен")
+        return 0
+    finally:
+        service.close()
+
+
+def main():
+    setup_logging(mode="direct")
+    logging.getLogger().setLevel(logging.WARNING)
+    return asyncio.run(check())
+
+
+if __name__ == '__main__':
+    sys.exit(main())
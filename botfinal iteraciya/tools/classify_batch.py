@@ -0,0 +1,162 @@
+#Пакетная классификация запросов без бота: файл (по запросу в строке) или таблица
+#unrecognized_queries прогоняются через NLPProcessor.classify в нескольких процессах.
+#Для каждого запроса пишутся категория, оценка и задержка в CSV или JSONL.
+#Вход читается потоком, в работе одновременно не больше --inflight пакетов, поэтому память
+#не растёт с размером входа. Порядок строк на выходе совпадает с порядком на входе.
+#Запуск из папки бота:
+#  python -m tools.classify_batch --input queries.txt --output result.csv
+#  python -m tools.classify_batch --db typo_database.db --output rescored.jsonl
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import sqlite3
+import logging
+import argparse
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+FIELDS = ("query", "frequency", "category", "score", "recognized", "latency_ms")
+
+# Экземпляр NLPProcessor внутри рабочего процесса
+_processor = None
+
+
+def _init_worker(db_path):
+    global _processor
+    logging.getLogger().setLevel(logging.WARNING)
+    from request.nlp import NLPProcessor
+    # Опечатки, выученные при классификации, пишутся во временную копию базы
+    _processor = NLPProcessor(db_path=db_path)
+
+
+def _classify_chunk(chunk):
+    from request.nlp import CONFIDENCE_THRESHOLD
+    results = []
+    for query, frequency in chunk:
+        started = time.perf_counter()
+        category_id, score = _processor.classify(query)
+        latency = time.perf_counter() - started
+        results.append({
+            "query": query,
+            "frequency": frequency,
+            "category": category_id,
+            "score": round(float(score), 4),
+            "recognized": category_id is not None and score > CONFIDENCE_THRESHOLD,
+            "latency_ms": round(latency * 1000, 3),
+        })
+    return results
+
+
+def queries_from_file(path):
+    stream = sys.stdin if path == "-" else open(path, encoding="utf-8", errors="replace")
+    try:
+        for line in stream:
+            query = line.rstrip("\r\n")
+            if query.strip():
+                yield query, None
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def queries_from_db(path):
+    conn = sqlite3.connect(path)
+    try:
+        # Курсор отдаёт строки по мере чтения, таблица целиком в память не загружается
+        for query, frequency in conn.execute("SELECT query, frequency FROM unrecognized_queries "
+                                             "ORDER BY frequency DESC"):
+            yield query, frequency
+    finally:
+        conn.close()
+
+
+def chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class ResultWriter:
+    def __init__(self, stream, output_format):
+        self.stream = stream
+        self.output_format = output_format
+        if output_format == "csv":
+            self.writer = csv.DictWriter(stream, fieldnames=FIELDS)
+            self.writer.writeheader()
+
+    def write(self, row):
+        if self.output_format == "csv":
+            self.writer.writerow(row)
+        else:
+            self.stream.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+def run(queries, writer, workers, chunk_size, inflight, db_path):
+    #Раздаёт пакеты процессам, держа в работе не больше inflight пакетов, и пишет результаты по порядку
+    total = recognized = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(db_path,)) as pool:
+        pending = deque()
+        for chunk in chunks(queries, chunk_size):
+            pending.append(pool.submit(_classify_chunk, chunk))
+            if len(pending) >= inflight:
+                total, recognized = _drain(pending.popleft(), writer, total, recognized)
+        while pending:
+            total, recognized = _drain(pending.popleft(), writer, total, recognized)
+    return total, recognized
+
+
+def _drain(future, writer, total, recognized):
+    for row in future.result():
+        writer.write(row)
+        total += 1
+        recognized += row["recognized"]
+    return total, recognized
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетная классификация запросов NLPProcessor")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input", help="файл с запросами, по одному в строке ('-' - stdin)")
+    source.add_argument("--db", help="база с таблицей unrecognized_queries (typo_database.db)")
+    parser.add_argument("--output", default="-", help="файл результата ('-' - stdout)")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="формат (по умолчанию по расширению)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="число процессов")
+    parser.add_argument("--chunk-size", type=int, default=64, help="запросов в одном пакете")
+    parser.add_argument("--inflight", type=int, default=0, help="пакетов в работе (0 - два на процесс)")
+    parser.add_argument("--typo-db", default="typo_database.db",
+                        help="база опечаток, копия которой используется при классификации")
+    args = parser.parse_args()
+
+    output_format = args.format or ("jsonl" if args.output.endswith((".jsonl", ".json")) else "csv")
+    inflight = args.inflight or 2 * max(1, args.workers)
+    queries = queries_from_file(args.input) if args.input else queries_from_db(args.db)
+
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, "typo_database.db")
+        if os.path.exists(args.typo_db):
+            shutil.copyfile(args.typo_db, db_path)
+        stream = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8", newline="")
+        try:
+            total, recognized = run(queries, ResultWriter(stream, output_format), max(1, args.workers),
+                                    max(1, args.chunk_size), inflight, db_path)
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+    elapsed = time.perf_counter() - started
+    print(f"Обработано запросов: {total}, распознано: {recognized}, "
+          f"время: {elapsed:.1f} s ({total / elapsed if elapsed else 0:.0f} запросов/с)", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
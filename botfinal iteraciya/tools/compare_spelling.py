@@ -0,0 +1,95 @@
+#Сверка индекса исправления опечаток с прежним линейным алгоритмом.
+#Токены берутся из unrecognized.log (строки "Unrecognized token") и таблицы unrecognized_queries.
+#База опечаток подменяется временной копией: выученные при прогреве опечатки в настоящую не пишутся.
+#Запуск из папки бота:  python -m tools.compare_spelling [unrecognized.log] [typo_database.db]
+import re
+import sys
+import copy
+import sqlite3
+import logging
+import tempfile
+from difflib import get_close_matches
+from fuzzywuzzy import fuzz
+
+from request.nlp import NLPProcessor
+from tools.bench_nlp import stub_typo_db
+from tools.log_lines import decode_line
+
+TOKEN_RE = re.compile(r"Unrecognized token: '(.*)'")
+
+
+def tokens_from_log(path):
+    tokens = set()
+    try:
+        with open(path, 'rb') as f:
+            for raw in f:
+                match = TOKEN_RE.search(decode_line(raw).rstrip('\r\n'))
+                if match:
+                    tokens.add(match.group(1))
+    except OSError as e:
+        print(f"Не удалось прочитать {path}: {e}")
+    return tokens
+
+
+def tokens_from_db(path, nlp_processor):
+    tokens = set()
+    try:
+        conn = sqlite3.connect(path)
+        cursor = conn.cursor()
+        cursor.execute("SELECT query FROM unrecognized_queries")
+        for (query,) in cursor.fetchall():
+            tokens.update(nlp_processor.preprocess_text(query))
+        conn.close()
+    except sqlite3.Error as e:
+        print(f"Не удалось прочитать {path}: {e}")
+    return tokens
+
+
+def legacy_correct(token, typo_dictionary, dictionary):
+    #Прежний алгоритм _correct_spelling без записи в базу
+    for correct_word, typos in typo_dictionary.items():
+        if token in typos:
+            return correct_word
+    matches = get_close_matches(token, dictionary, n=1, cutoff=0.5)
+    if matches:
+        return matches[0]
+    best_match = None
+    best_score = 0
+    for word in sorted(dictionary):
+        score = fuzz.ratio(token, word)
+        if score > 50 and score > best_score:
+            best_match = word
+            best_score = score
+    return best_match if best_match else token
+
+
+def main():
+    log_path = sys.argv[1] if len(sys.argv) > 1 else 'unrecognized.log'
+    db_path = sys.argv[2] if len(sys.argv) > 2 else 'typo_database.db'
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as directory:
+        nlp_processor = NLPProcessor(db_path=stub_typo_db(db_path, directory))
+        try:
+            tokens = tokens_from_log(log_path) | tokens_from_db(nlp_processor.db_path, nlp_processor)
+            dictionary = nlp_processor.index.keyword_index.dictionary
+            # Прежний алгоритм сверяется с копией словаря, которую обработчик уже не изменит
+            typo_dictionary = copy.deepcopy(nlp_processor.typo_dictionary)
+
+            mismatches = []
+            for token in sorted(tokens):
+                expected = legacy_correct(token, typo_dictionary, dictionary)
+                actual, _ = nlp_processor.spelling.correct(token)
+                if expected != actual:
+                    mismatches.append((token, expected, actual))
+        finally:
+            nlp_processor.close()
+
+    print(f"Проверено токенов: {len(tokens)}, расхождений: {len(mismatches)}")
+    for token, expected, actual in mismatches:
+        print(f"  {token!r}: было {expected!r}, стало {actual!r}")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
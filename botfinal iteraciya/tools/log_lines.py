@@ -0,0 +1,21 @@
+#Чтение строк логов бота, общее для инструментов в tools/
+
+
+def decode_line(raw):
+    # Логи писались в разных кодировках: сначала utf-8, затем cp1251
+    try:
+        line = raw.decode('utf-8')
+    except UnicodeDecodeError:
+        return raw.decode('cp1251', errors='replace')
+    return fix_mojibake(line)
+
+
+def fix_mojibake(line):
+    #utf-8, однажды прочитанный как cp1251 ("РџСЂРёРІРµС‚"), возвращается к исходному тексту
+    if "Р" not in line and "С" not in line:
+        return line
+    try:
+        fixed = line.encode('cp1251').decode('utf-8')
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return line
+    return fixed if len(fixed) < len(line) else line
@@ -0,0 +1,179 @@
+#Потоковый разбор bot.log и его ротированных копий (bot.log.1, bot.log.2.gz, ...): задержки
+#обработки обновлений ("Update id=... is handled. Duration N ms") по часам, самые медленные
+#обновления и строки NLP, записанные перед ними.
+#Файлы читаются построчно, с места, где остановился прошлый запуск (состояние в --state),
+#поэтому повторный запуск разбирает только новые строки. Запуск из папки бота:
+#  python -m tools.log_stats                 - дочитать логи и вывести отчёт
+#  python -m tools.log_stats --reset         - разобрать всё заново
+import os
+import re
+import sys
+import glob
+import gzip
+import json
+import math
+import heapq
+import hashlib
+import argparse
+from collections import deque
+
+from tools.log_lines import decode_line
+
+LINE_RE = re.compile(r"^(\d{4}-\d\d-\d\d \d\d):\d\d:\d\d,\d{3} - (\w+) - (.*)$")
+UPDATE_RE = re.compile(r"Update id=(\d+) is (not )?handled\. Duration (\d+) ms")
+# Строки обработки свободного текста, которые показываются рядом с медленными обновлениями
+NLP_MARKERS = ("Processing user request", "Preprocessing text", "Matching pattern", "Corrected",
+               "Unrecognized", "Response generated", "Intent matcher", "Slow NLP request", "NLP ",
+               "Keyword", "typo", "Knowledge base")
+# Гистограмма задержек: корзины растут в геометрической прогрессии (погрешность перцентиля до 10%)
+BUCKET_RATIO = 1.1
+DEFAULT_STATE = "log_stats.state.json"
+
+
+def bucket_of(ms):
+    return 0 if ms < 1 else int(math.log(ms, BUCKET_RATIO)) + 1
+
+
+def bucket_upper(bucket):
+    return 1.0 if bucket == 0 else BUCKET_RATIO ** bucket
+
+
+def percentile(histogram, fraction):
+    #Верхняя граница корзины, в которую попадает перцентиль
+    total = sum(histogram.values())
+    rank = max(1, math.ceil(fraction * total))
+    seen = 0
+    for bucket in sorted(histogram, key=int):
+        seen += histogram[bucket]
+        if seen >= rank:
+            return bucket_upper(int(bucket))
+    return 0.0
+
+
+def log_files(path):
+    #Основной лог и его ротированные копии, от самой старой к самой новой
+    rotated = []
+    for name in glob.glob(glob.escape(path) + ".*"):
+        match = re.fullmatch(re.escape(path) + r"\.(\d+)(\.gz)?", name)
+        if match:
+            rotated.append((int(match.group(1)), name))
+    files = [name for _, name in sorted(rotated, reverse=True)]
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def open_log(path):
+    return gzip.open(path, 'rb') if path.endswith(".gz") else open(path, 'rb')
+
+
+def fingerprint(path):
+    #Файл узнаётся по первой строке: после ротации bot.log -> bot.log.1 она не меняется
+    with open_log(path) as f:
+        first = f.readline(4096)
+    if not first.endswith(b"\n"):
+        return None
+    return hashlib.sha1(first).hexdigest()
+
+
+class LogStats:
+    def __init__(self, state=None, top=10, context=30):
+        state = state or {}
+        self.offsets = state.get("offsets", {})
+        self.hours = state.get("hours", {})
+        self.slowest = [tuple(item) for item in state.get("slowest", [])]
+        heapq.heapify(self.slowest)
+        self.lines_read = 0
+        self.top = top
+        self.recent = deque(maxlen=context)
+
+    def state(self):
+        return {"offsets": self.offsets, "hours": self.hours, "slowest": sorted(self.slowest, reverse=True)}
+
+    def process_file(self, path):
+        key = fingerprint(path)
+        if key is None:
+            return None
+        offset = self.offsets.get(key, 0)
+        with open_log(path) as f:
+            f.seek(offset)
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    # Строка ещё дописывается, дочитаем её в следующий раз
+                    break
+                offset += len(raw)
+                self.process_line(decode_line(raw).rstrip("\r\n"), path)
+        self.offsets[key] = offset
+        return key
+
+    def process_line(self, line, path):
+        self.lines_read += 1
+        match = LINE_RE.match(line)
+        if not match:
+            return
+        hour, level, message = match.groups()
+        update = UPDATE_RE.search(message)
+        if update is None:
+            if any(marker in message for marker in NLP_MARKERS):
+                self.recent.append(line)
+            return
+        update_id, not_handled, duration = update.group(1), update.group(2), int(update.group(3))
+        histogram = self.hours.setdefault(hour, {})
+        bucket = str(bucket_of(duration))
+        histogram[bucket] = histogram.get(bucket, 0) + 1
+        # Строки NLP с прошлого обновления относятся к этому
+        context = list(self.recent)
+        self.recent.clear()
+        entry = (duration, update_id, line[:23], os.path.basename(path), bool(not_handled), context)
+        if len(self.slowest) < self.top:
+            heapq.heappush(self.slowest, entry)
+        elif duration > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    def report(self, context_lines):
+        print(f"{'час':<14} {'обновлений':>10} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}  (ms)")
+        for hour in sorted(self.hours):
+            histogram = self.hours[hour]
+            count = sum(histogram.values())
+            print(f"{hour:<14} {count:>10} {percentile(histogram, 0.50):>8.0f} {percentile(histogram, 0.95):>8.0f} "
+                  f"{percentile(histogram, 0.99):>8.0f} {percentile(histogram, 1.0):>8.0f}")
+        print(f"\nСамые медленные обновления ({len(self.slowest)}):")
+        for duration, update_id, timestamp, name, not_handled, context in sorted(self.slowest, reverse=True):
+            status = "не обработано" if not_handled else "обработано"
+            print(f"  {duration} ms  id={update_id}  {timestamp}  {name}  ({status})")
+            for line in context[-context_lines:]:
+                print(f"      {line[:200]}")
+
+
+def load_state(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Задержки обработки обновлений по bot.log")
+    parser.add_argument("--log", default="bot.log", help="основной лог; ротированные копии находятся рядом")
+    parser.add_argument("--state", default=DEFAULT_STATE, help="файл с позициями чтения и накопленной статистикой")
+    parser.add_argument("--reset", action="store_true", help="забыть прошлые запуски и разобрать всё заново")
+    parser.add_argument("--top", type=int, default=10, help="сколько самых медленных обновлений показать")
+    parser.add_argument("--context", type=int, default=8, help="сколько строк NLP показать перед обновлением")
+    args = parser.parse_args()
+
+    stats = LogStats(None if args.reset else load_state(args.state), top=args.top,
+                     context=max(args.context, 1))
+    seen = {stats.process_file(path) for path in log_files(args.log)}
+    # Позиции файлов, удалённых ротацией, больше не нужны
+    stats.offsets = {key: offset for key, offset in stats.offsets.items() if key in seen}
+    stats.report(args.context)
+    print(f"\nНовых строк разобрано: {stats.lines_read}")
+
+    with open(args.state, 'w', encoding='utf-8') as f:
+        json.dump(stats.state(), f, ensure_ascii=False)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
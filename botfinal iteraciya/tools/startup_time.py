@@ -0,0 +1,101 @@
+#Замер холодного старта бота: время импорта каждого модуля (python -X importtime) и время
+#от запуска run.py до момента, когда бот готов начать опрос Telegram ("Start polling").
+#Подключение к Telegram не выполняется. Запуск из папки бота:
+#  python -m tools.startup_time                 - отчёт
+#  python -m tools.startup_time --budget 1.5    - код выхода 1, если старт дольше 1.5 с
+import re
+import sys
+import json
+import argparse
+import subprocess
+
+IMPORTTIME_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+# Модули самого бота, их время выводится всегда
+PROJECT_PREFIXES = ("run", "bot", "config", "utils", "logging_setup", "handlers", "keyboards", "request")
+
+# Код, который выполняется в отдельном процессе: всё, что делает run.py до dp.start_polling
+STARTUP_SNIPPET = '''
+import time, json, asyncio
+started = time.perf_counter()
+import run
+imported = time.perf_counter()
+
+async def startup():
+    run.initialize_database()
+    run.check_tables()
+    run.nlp_service.start()
+    ready = time.perf_counter()
+    run.nlp_service.close()
+    return ready
+
+ready = asyncio.run(startup())
+print("STARTUP " + json.dumps({"imports": imported - started, "until_polling": ready - started}))
+'''
+
+
+def measure(python):
+    #Запускает старт бота в новом процессе и возвращает (времена этапов, строки importtime)
+    result = subprocess.run([python, "-X", "importtime", "-c", STARTUP_SNIPPET],
+                            capture_output=True, text=True, encoding="utf-8", errors="replace")
+    timings = None
+    for line in result.stdout.splitlines():
+        if line.startswith("STARTUP "):
+            timings = json.loads(line[len("STARTUP "):])
+    if timings is None:
+        raise RuntimeError(f"Startup failed (exit code {result.returncode}):\n{result.stderr[-2000:]}")
+    modules = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            # Глубина вложенности импорта: importtime сдвигает имя на 2 пробела за уровень
+            modules.append((name, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return timings, modules
+
+
+def is_project_module(name):
+    return any(name == prefix or name.startswith(prefix + ".") for prefix in PROJECT_PREFIXES)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время холодного старта бота")
+    parser.add_argument("--budget", type=float, default=0.0,
+                        help="допустимое время до начала опроса, с (0 - не проверять)")
+    parser.add_argument("--top", type=int, default=15, help="сколько самых тяжёлых импортов показать")
+    parser.add_argument("--runs", type=int, default=3, help="сколько раз замерить (берётся лучший)")
+    parser.add_argument("--python", default=sys.executable, help="интерпретатор для замера")
+    args = parser.parse_args()
+
+    best = None
+    for _ in range(max(1, args.runs)):
+        timings, modules = measure(args.python)
+        if best is None or timings["until_polling"] < best[0]["until_polling"]:
+            best = (timings, modules)
+    timings, modules = best
+
+    print(f"Импорт модулей: {timings['imports'] * 1000:.0f} ms")
+    print(f"До начала опроса Telegram: {timings['until_polling'] * 1000:.0f} ms")
+
+    print("\nМодули бота (накопительно, ms):")
+    for name, self_us, cumulative_us, depth in modules:
+        if is_project_module(name):
+            print(f"  {cumulative_us / 1000:8.1f}  {name}")
+
+    print(f"\nСамые тяжёлые импорты (накопительно, ms), топ {args.top}:")
+    # Вложенные импорты уже входят в накопительное время родителя, поэтому берём прямые импорты run.py
+    heaviest = sorted((module for module in modules if module[3] == 1), key=lambda module: -module[2])
+    for name, self_us, cumulative_us, depth in heaviest[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f}  {name}")
+
+    heavy_loaded = sorted({name.split(".")[0] for name, _, _, _ in modules} & {"spacy", "nltk", "fuzzywuzzy", "numpy"})
+    if heavy_loaded:
+        print(f"\nПри старте загружены тяжёлые NLP-библиотеки: {', '.join(heavy_loaded)}")
+
+    if args.budget > 0 and timings["until_polling"] > args.budget:
+        print(f"\nСтарт дольше бюджета: {timings['until_polling']:.2f} s > {args.budget:.2f} s")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
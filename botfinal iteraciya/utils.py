@@ -2,20 +2,19 @@ import sqlite3
 #import types
 #from aiogram.types import Message
 
-# Путь к базе данных
-DB_PATH = 'user_data.db'
+# Соединение текущего потока, переиспользуется между запросами (см. database.py)
+from database import get_connection
 
-# Глобальное соединение с базой данных и курсор 
-conn = sqlite3.connect(DB_PATH)
-cursor = conn.cursor()
+# Роли пользователей бота (None - пользователя нет в базе)
+ROLE_ADMIN = "admin"
+ROLE_USER = "user"
 
 def initialize_database():
     
     #Инициализация базы данных: создание таблиц, если они отсутствуют.
     
-    conn = None
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_connection()
         cursor = conn.cursor()
         # Таблица для пользователей
         cursor.execute('''
@@ -69,111 +68,47 @@ def initialize_database():
             ''')
         
 
-        conn.commit()
-        print("База данных инициализирована: таблицы созданы или уже существуют.")
-    except sqlite3.Error as e:
-        print(f"Ошибка при инициализации базы данных: {e}")
-    finally:
-        if conn:
-            conn.close()
-
-def id_authorized(user_id: int) -> bool:
-    
-    #Проверяет, авторизован ли пользователь по айди.
-    
-    conn = None
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute('''
-        SELECT user_id FROM users_table WHERE user_id = ?
-        ''', (user_id,))
-        result = cursor.fetchone()
-        print(f"Проверка авторизации для username={user_id}: {'авторизован' if result else 'не авторизован'}")
-        return result is not None
-    except sqlite3.Error as e:
-        print(f"Ошибка при проверке авторизации пользователя: {e}")
-        return False
-    finally:
-        if conn:
-            conn.close()
-
-def user_authorized(username: str) -> bool:
-    
-    #Проверяет, авторизован ли пользователь по юзернейм.
-    conn = None
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
+        # Версия каталога (роутеры и тарифы): растёт при каждом изменении, по ней кэш каталога
+        # узнаёт об изменениях, в том числе сделанных другими процессами бота
         cursor.execute('''
-        SELECT username FROM users_table WHERE username = ?
-        ''', (username,))
-        result = cursor.fetchone()
-        print(f"Проверка авторизации для username={username}: {'авторизован' if result else 'не авторизован'}")
-        return result is not None
-    except sqlite3.Error as e:
-        print(f"Ошибка при проверке авторизации пользователя: {e}")
-        return False
-    finally:
-        if conn:
-            conn.close()
+        CREATE TABLE IF NOT EXISTS catalog_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL)
+            ''')
+        cursor.execute("INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0)")
 
 
-def admin_authorized(user_id: int) -> bool:
-    
-    #Проверяет, авторизован ли пользователь и является ли он администратором.
-    
-    conn = None
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT admin_status FROM users_table WHERE user_id = ?
-        ''', (user_id,))
-        result = cursor.fetchone()
-
-        if result:
-            admin_status = result[0]
-            print(
-                f"Проверка статуса администратора для user_id={user_id}: {'администратор' if admin_status else 'не администратор'}")
-            return bool(admin_status)
-        else:
-            print(f"Пользователь с user_id={user_id} не найден.")
-            return False
+        conn.commit()
+        print("База данных инициализирована: таблицы созданы или уже существуют.")
     except sqlite3.Error as e:
-        print(f"Ошибка при проверке статуса администратора: {e}")
-        return False
-    finally:
-        if conn:
-            conn.close()
+        print(f"Ошибка при инициализации базы данных: {e}")
 
 def check_tables():
     
     #Проверяет, существуют ли таблицы в базе данных.
     
+    cursor = get_connection().cursor()
     cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
     tables = cursor.fetchall()
     print(f"Таблицы в базе данных: {tables}")
 
 def delete_tariff_from_db(tariff_id: int) -> bool:
-    conn = sqlite3.connect('user_data.db')
+    conn = get_connection()
     cursor = conn.cursor()
     
     # Проверяем существование тарифа
     cursor.execute("SELECT 1 FROM tariffs_table WHERE id_tarif = ?", (tariff_id,))
     if not cursor.fetchone():
-        conn.close()
         return False
     
     # Удаляем тариф
     cursor.execute("DELETE FROM tariffs_table WHERE id_tarif = ?", (tariff_id,))
-    conn.commit()
-    conn.close()
+    bump_catalog_version()
     return True
 
 def get_tarifs_by_id(tariff_id: int) -> tuple | None:
     try:
-        conn = sqlite3.connect('user_data.db')
+        conn = get_connection()
         cursor = conn.cursor()
         
         cursor.execute("SELECT * FROM tariffs_table WHERE id_tarif = ?", (tariff_id,))
@@ -184,32 +119,26 @@ def get_tarifs_by_id(tariff_id: int) -> tuple | None:
     except sqlite3.Error as e:
         print(f"Ошибка при получении тарифа: {e}")
         return None
-        
-    finally:
-        if conn:
-            conn.close()
 
 
 def delete_router_from_db(router_id: int) -> bool:
-    conn = sqlite3.connect('user_data.db')
+    conn = get_connection()
     cursor = conn.cursor()
     
     # Проверяем существование тарифа
     cursor.execute("SELECT 1 FROM routers_table WHERE model_id = ?", (router_id,))
     if not cursor.fetchone():
-        conn.close()
         return False
     
     # Удаляем тариф
     cursor.execute("DELETE FROM routers_table WHERE model_id = ?", (router_id,))
-    conn.commit()
-    conn.close()
+    bump_catalog_version()
     return True
 
 
 def get_router_by_id(router_id: int) -> tuple | None:
     try:
-        conn = sqlite3.connect('user_data.db')
+        conn = get_connection()
         cursor = conn.cursor()
         
         cursor.execute("SELECT * FROM routers_table WHERE model_id = ?", (router_id,))
@@ -220,7 +149,158 @@ def get_router_by_id(router_id: int) -> tuple | None:
     except sqlite3.Error as e:
         print(f"Ошибка при получении роутера: {e}")
         return None
-        
-    finally:
-        if conn:
-            conn.close()
+
+
+# Запросы, которые раньше выполнялись прямо в обработчиках. Вызываются через repositories.py
+# в пуле потоков базы, ошибки sqlite3 передаются вызывающему.
+# Изменяющие функции (add_*, update_*, delete_*, reply_*) не делают commit сами: их выполняет
+# DatabaseWriter, объединяя несколько записей в одну транзакцию
+
+def get_user(user_id: int) -> tuple | None:
+    cursor = get_connection().cursor()
+    cursor.execute('SELECT user_id, username, fio, admin_status FROM users_table WHERE user_id = ?', (user_id,))
+    return cursor.fetchone()
+
+
+def add_user(user_id: int, username: str, fio: str):
+    conn = get_connection()
+    conn.execute('''
+        INSERT INTO users_table (user_id, username, fio, admin_status)
+        VALUES (?, ?, ?, 0)
+    ''', (user_id, username, fio))
+
+
+def get_user_role(user_id: int) -> str | None:
+    #Единственная проверка прав: ROLE_ADMIN, ROLE_USER или None, если пользователя нет в базе.
+    #Обработчики получают роль через AuthMiddleware (middlewares.py) из кэша ролей
+    cursor = get_connection().cursor()
+    cursor.execute("SELECT admin_status FROM users_table WHERE user_id = ?", (user_id,))
+    result = cursor.fetchone()
+    if result is None:
+        return None
+    return ROLE_ADMIN if result[0] else ROLE_USER
+
+
+def get_admin_ids() -> list:
+    cursor = get_connection().cursor()
+    cursor.execute("SELECT user_id FROM users_table WHERE admin_status = 1")
+    return [row[0] for row in cursor.fetchall()]
+
+
+def add_router_to_db(data: dict):
+    conn = get_connection()
+    conn.execute('''
+    INSERT INTO routers_table (model_id, model_name, model_cost, mesh, tariff_1000, g5_diap, number_ports)
+    SELECT COALESCE(MAX(model_id), 0) + 1, ?, ?, ?, ?, ?, ? 
+    FROM routers_table
+''', (
+        data['routername'],
+        data['routercost'],
+        data['routermesh'],
+        data['routertariff'],
+        data['routerg5'],
+        data['routerports'],
+    ))
+    bump_catalog_version()
+
+
+def update_router_in_db(router_id, data):
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE routers_table
+        SET model_name = ?, model_cost = ?, mesh = ?, tariff_1000 = ?, g5_diap = ?, number_ports = ?
+        WHERE model_id = ?
+    ''', (
+        data['routername'],
+        data['routercost'],
+        data['routermesh'],
+        data['routertariff'],
+        data['routerg5'],
+        data['routerports'],
+        router_id
+    ))
+    bump_catalog_version()
+    return True
+
+
+def add_tariff_to_db(data: dict):
+    conn = get_connection()
+    conn.execute('''
+        INSERT INTO tariffs_table (id_tarif, tarif_name, stoimost_tarif, stoimost_6month, stoimost_12month, akciya)
+        SELECT COALESCE(MAX(id_tarif), 0) + 1, ?, ?, ?, ?, ?
+        FROM tariffs_table
+    ''', 
+    (
+        data['tarif_name'],
+        data['stoimost_tarif'],
+        data['stoimost_6month'],
+        data['stoimost_12month'],
+        data['akciya'],
+    ))
+    bump_catalog_version()
+
+
+def update_tariff_in_db(tariff_id, data):
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE tariffs_table
+        SET tarif_name = ?, stoimost_tarif = ?, stoimost_6month = ?, stoimost_12month = ?, akciya = ?
+        WHERE id_tarif = ?
+''',    ( data['tariff_name'],
+        data['tarifcost'],
+        data['cost_6month'],
+        data['cost_12month'],
+        data['editakciya'],
+        tariff_id
+    ))
+    bump_catalog_version()
+    return True
+
+
+def add_feedback_to_db(user_id: int, username: str, text: str):
+    conn = get_connection()
+    conn.execute('''
+        INSERT INTO feedback_table 
+        (user_fb_id, username_fb, message)
+        VALUES (?, ?, ?)
+    ''', (user_id, username, text))
+
+
+def reply_feedback_in_db(user_id: int, admin_id: int, reply_text: str, status: str) -> int:
+    #Отмечает новые сообщения пользователя отвеченными, возвращает число изменённых строк
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE feedback_table 
+        SET status = ?,
+            admin_id = ?,
+            reply_message = ?
+        WHERE user_fb_id = ? AND status = 'new'
+    ''', (status, admin_id, reply_text, user_id))
+    return cursor.rowcount
+
+
+def get_new_feedback(limit: int = 50) -> list:
+    cursor = get_connection().cursor()
+    cursor.execute('''
+        SELECT id_fb, user_fb_id, username_fb, message, created_at 
+        FROM feedback_table 
+        WHERE status = 'new'
+        ORDER BY created_at DESC
+        LIMIT ?
+    ''', (limit,))
+    return cursor.fetchall()
+
+
+def get_catalog_version() -> int:
+    cursor = get_connection().cursor()
+    cursor.execute("SELECT version FROM catalog_version WHERE id = 1")
+    result = cursor.fetchone()
+    return result[0] if result else 0
+
+
+def bump_catalog_version():
+    # Выполняется в той же транзакции, что и изменение роутеров или тарифов
+    get_connection().execute("UPDATE catalog_version SET version = version + 1 WHERE id = 1")